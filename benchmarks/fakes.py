@@ -0,0 +1,186 @@
+from types import SimpleNamespace
+from typing import Dict, List
+import hashlib
+import re
+import threading
+import time
+import numpy as np
+
+# -----------------------------
+# Stand-ins for the external services, so the benchmarks measure this code
+# -----------------------------
+
+
+class FakeEmbedder:
+    """
+    ollama.Client stand-in for the embedding stage: a fixed latency per
+    request, then deterministic unit vectors derived from each text.
+    """
+
+    def __init__(self, latency: float = 0.02, dim: int = 768):
+        self.latency = latency
+        self.dim = dim
+        self.requests = 0
+        self.texts = 0
+
+    def vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(self.dim)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def embed(self, model: str, input: List[str]):
+        time.sleep(self.latency)
+        self.requests += 1
+        self.texts += len(input)
+        return SimpleNamespace(embeddings=[self.vector(t) for t in input])
+
+
+class FakeLLM:
+    """
+    ollama.Client stand-in for chat: streams `tokens` fixed chunks with a
+    fixed latency before the first one and between the rest; never asks for tools.
+    """
+
+    def __init__(self, first_token: float = 0.2, per_token: float = 0.005, tokens: int = 200):
+        self.first_token = first_token
+        self.per_token = per_token
+        self.tokens = tokens
+
+    def chat(self, model: str, messages: list, tools: list = None, stream: bool = False):
+        def chunks():
+            time.sleep(self.first_token)
+            for i in range(self.tokens):
+                if i:
+                    time.sleep(self.per_token)
+                yield SimpleNamespace(message=SimpleNamespace(content=f"tok{i} ", tool_calls=None))
+        return chunks()
+
+
+class _Result:
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+
+    def consume(self):
+        return None
+
+    def __iter__(self):
+        return iter(SimpleNamespace(data=lambda r=r: r) for r in self.rows)
+
+
+class _Session:
+    def __init__(self, graph: "InMemoryGraph"):
+        self.graph = graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, cypher: str, params: Dict = None):
+        return _Result(self.graph.execute(cypher, params or {}))
+
+    def execute_write(self, work):
+        with self.graph.lock:
+            return work(self)
+
+    execute_read = execute_write
+
+
+class InMemoryGraph:
+    """
+    neo4j.Driver stand-in: sessions hand every statement to execute(), which
+    keeps what retrieval needs (AST nodes with their embeddings, symbols,
+    files) and counts every row written. Reads it does not model return no
+    rows, so the traversal stage sees an empty neighbourhood; use a real
+    Neo4j (--graph neo4j) to benchmark that part.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.nodes: Dict[int, Dict] = {}
+        self.symbols: Dict[int, Dict] = {}
+        self.files: Dict[tuple, Dict] = {}
+        self.statements = 0
+        self.rows_written = 0
+        self._matrix = None
+
+    def session(self, **kwargs):
+        return _Session(self)
+
+    def close(self):
+        pass
+
+    def execute(self, cypher: str, params: Dict) -> List[Dict]:
+        # imported late: the service modules read their config at import time
+        from service.graph import graph_writer, retrieval, symbol_graph
+
+        with self.lock:
+            self.statements += 1
+            rows = params.get("rows")
+            if rows is not None:
+                self.rows_written += len(rows)
+            if cypher is graph_writer.UPSERT_NODES:
+                for n in rows:
+                    self.nodes[n["id"]] = n
+                self._matrix = None
+            elif cypher is symbol_graph.UPSERT_SYMBOLS:
+                for s in rows:
+                    self.symbols[s["id"]] = s
+            elif cypher is graph_writer.UPSERT_FILES:
+                self.rows_written += len(params["files"])
+                for f in params["files"]:
+                    self.files[(f["repo"], f["file"])] = f
+            elif cypher in (retrieval.VECTOR_QUERY, retrieval.EXACT_VECTOR_QUERY):
+                return self._vector(params)
+            elif cypher is retrieval.FULLTEXT_QUERY:
+                return self._fulltext(params)
+            elif "RETURN f.path AS path, f.content_hash AS hash" in cypher:
+                # get_file_hashes
+                return [{"path": f["file"], "hash": f["hash"]} for (repo, _), f in self.files.items()
+                        if repo == params.get("repo")]
+            return []
+
+    def _hit(self, n: Dict, score: float) -> Dict:
+        f = self.files.get((n["repo"], n["file"]), {})
+        return {"node": {"id": n["id"], "semantic_type": n["semantic_type"], "name": n["name"], "file": n["file"],
+                         "text": n["text"], "start_byte": n["start_byte"], "end_byte": n["end_byte"],
+                         "hash": f.get("hash")},
+                "score": score}
+
+    def _keep(self, n: Dict, params: Dict) -> bool:
+        return (n["repo"] == params["repo"]
+                and (params.get("path_prefix") is None or n["file"].startswith(params["path_prefix"]))
+                and (params.get("semantic_types") is None or n["semantic_type"] in params["semantic_types"]))
+
+    def _vector(self, params: Dict) -> List[Dict]:
+        # exact cosine: the stand-in has no ANN index, both vector queries are served the same way
+        if self._matrix is None:
+            embedded = [n for n in self.nodes.values() if n.get("embedding") is not None]
+            self._matrix = (embedded, np.array([n["embedding"] for n in embedded], dtype=np.float32)
+                            if embedded else np.zeros((0, 1), dtype=np.float32))
+        embedded, matrix = self._matrix
+        if not embedded:
+            return []
+        scores = matrix @ np.asarray(params["vector"], dtype=np.float32)
+        hits = []
+        for i in np.argsort(-scores, kind="stable"):
+            if self._keep(embedded[i], params):
+                hits.append(self._hit(embedded[i], float(scores[i])))
+                if len(hits) >= params["top_k"]:
+                    break
+        return hits
+
+    def _fulltext(self, params: Dict) -> List[Dict]:
+        terms = set(re.findall(r"\w+", params["lucene"].split(") AND repo:")[0]))
+        hits = []
+        for s in self.symbols.values():
+            n = self.nodes.get(s["id"])
+            if s["repo"] != params["repo"] or n is None or not self._keep(n, params):
+                continue
+            words = set(re.findall(r"\w+", f"{s['name']} {s['signature']}".lower()))
+            score = len(terms & words)
+            if score:
+                hits.append(self._hit(n, float(score)))
+        hits.sort(key=lambda h: (-h["score"], h["node"]["id"]))
+        return hits[:params["top_k"]]
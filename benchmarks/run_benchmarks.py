@@ -0,0 +1,249 @@
+"""
+Benchmarks of the ingestion and retrieval hot paths on a synthetic repo.
+
+    python -m benchmarks.run_benchmarks --files 200 --depth 3 --mix py:2,js:1,go:1,java:1 --calls 3
+    python -m benchmarks.run_benchmarks --graph neo4j        # against NEO4J_URI instead of the in-memory stand-in
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/<earlier>.json
+
+The embedder and the LLM are always fakes with fixed latencies (see
+fakes.py), so the numbers measure this code and the graph store, not the
+models. Results are written as JSON to benchmarks/results/.
+"""
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _configure(workdir: str):
+    # Before any service import: modules read their config when imported
+    os.environ["EMBED_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.db")
+    os.environ["SOURCE_STORE_PATH"] = os.path.join(workdir, "source_store")
+    os.environ["LOCAL_REPO_PATH"] = os.path.join(workdir, "repos") + os.sep
+
+
+def _percentiles(samples: list) -> dict:
+    import numpy as np
+    if not samples:
+        return {"p50_ms": None, "p99_ms": None, "mean_ms": None}
+    ms = np.array(samples) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 2), "p99_ms": round(float(np.percentile(ms, 99)), 2),
+            "mean_ms": round(float(ms.mean()), 2)}
+
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds else None
+
+
+def _peak_rss_mb() -> dict:
+    # ru_maxrss is in KiB on Linux
+    return {"self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)}
+
+
+def _git_commit() -> str:
+    result = subprocess.run(["git", "-C", os.path.dirname(os.path.abspath(__file__)), "rev-parse", "HEAD"],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return result.stdout.strip() or None
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="impact-bench-")
+    _configure(workdir)
+
+    from benchmarks.fakes import FakeEmbedder, FakeLLM, InMemoryGraph
+    from benchmarks.synthetic_repo import generate_repo, sample_queries
+    from service import clients
+    from service.graph import neo4j_conn, retrieval
+    from service.graph.ast_util import iter_nodes, extract_semantics
+    from service.graph.ast_with_embeddings import collect_code_graph, upsert_code_graph
+    from service.graph.graph_writer import GraphWriter
+    from service.graph.embeddings import attach_embeddings
+    from service.parser.ts_parser import parse_file
+    from service.utils.repo_utils import list_source_files
+    from service.ingest_repo import initiate_graph
+    from service.llm import hybridRetriever
+    from service.llm.result_cache import cache
+
+    embedder = FakeEmbedder(latency=args.embed_latency)
+    clients.override("embedder", embedder)
+    clients.override("llm", FakeLLM(first_token=args.llm_first_token, per_token=args.llm_per_token,
+                                    tokens=args.llm_tokens))
+    graph = None
+    if args.graph == "memory":
+        graph = InMemoryGraph()
+        clients.override("neo4j", graph)
+
+    repo = f"bench_{args.seed}_{args.files}"
+    repo_path = os.path.join(os.environ["LOCAL_REPO_PATH"], repo)
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "compare")}
+    result = {"config": config, "commit": _git_commit(), "python": platform.python_version(),
+              "platform": platform.platform(), "started": datetime.now(timezone.utc).isoformat(), "stages": {}}
+    stages = result["stages"]
+    result["repo"] = generate_repo(repo_path, files=args.files, depth=args.depth, mix=args.mix,
+                                   functions=args.functions, calls=args.calls, seed=args.seed)
+
+    # discovery
+    started = time.perf_counter()
+    files = list_source_files(repo_path)
+    elapsed = time.perf_counter() - started
+    stages["discover"] = {"files": len(files), "seconds": round(elapsed, 3), "files_per_sec": _rate(len(files), elapsed)}
+
+    # parse_file
+    parsed = []
+    started = time.perf_counter()
+    for f in files:
+        parsed.append((f, *parse_file(f)))
+    elapsed = time.perf_counter() - started
+    stages["parse_file"] = {"files": len(parsed), "seconds": round(elapsed, 3),
+                            "files_per_sec": _rate(len(parsed), elapsed)}
+
+    # extract_semantics on every node
+    count = 0
+    started = time.perf_counter()
+    for _, tree, code in parsed:
+        for node, _ in iter_nodes(tree):
+            extract_semantics(node, code)
+            count += 1
+    elapsed = time.perf_counter() - started
+    stages["extract_semantics"] = {"nodes": count, "seconds": round(elapsed, 3), "nodes_per_sec": _rate(count, elapsed)}
+
+    # collect_code_graph (records for the writer)
+    records = []
+    started = time.perf_counter()
+    for f, tree, code in parsed:
+        records.append(collect_code_graph(repo, os.path.relpath(f, repo_path), tree, code))
+    elapsed = time.perf_counter() - started
+    count = sum(len(r["nodes"]) for r in records)
+    stages["collect_code_graph"] = {"nodes": count, "seconds": round(elapsed, 3), "nodes_per_sec": _rate(count, elapsed),
+                                    "files_per_sec": _rate(len(records), elapsed)}
+
+    # embeddings (fake model, fresh persistent cache)
+    nodes = [n for r in records for n in r["nodes"]]
+    started = time.perf_counter()
+    embedded = attach_embeddings(nodes)
+    elapsed = time.perf_counter() - started
+    stages["embed"] = {"embeddings": embedded, "requests": embedder.requests, "seconds": round(elapsed, 3),
+                       "embeddings_per_sec": _rate(embedded, elapsed)}
+
+    # graph writes
+    writer = GraphWriter()
+    started = time.perf_counter()
+    for r in records:
+        writer.add(r)
+    writer.flush()
+    elapsed = time.perf_counter() - started
+    stages["write"] = {"rows": writer.rows_written, "seconds": round(elapsed, 3),
+                       "writes_per_sec": _rate(writer.rows_written, elapsed),
+                       "files_per_sec": _rate(len(records), elapsed)}
+
+    # upsert_code_graph: the one-file-at-a-time path (collect + embed + write per file)
+    sample = parsed[:args.upsert_files]
+    started = time.perf_counter()
+    for f, tree, code in sample:
+        upsert_code_graph(repo, os.path.relpath(f, repo_path), tree, code)
+    elapsed = time.perf_counter() - started
+    stages["upsert_code_graph"] = {"files": len(sample), "seconds": round(elapsed, 3),
+                                   "files_per_sec": _rate(len(sample), elapsed)}
+
+    # initiate_graph end to end (process-pool parsing, embed and write threads) on a copy of the repo
+    pipeline_repo = f"{repo}_pipeline"
+    generate_repo(os.path.join(os.environ["LOCAL_REPO_PATH"], pipeline_repo), files=args.files, depth=args.depth,
+                  mix=args.mix, functions=args.functions, calls=args.calls, seed=args.seed)
+    rows_before = graph.rows_written if graph else None
+    started = time.perf_counter()
+    initiate_graph(pipeline_repo, incremental=False)
+    elapsed = time.perf_counter() - started
+    stages["initiate_graph"] = {"files": len(files), "nodes": count, "seconds": round(elapsed, 3),
+                                "files_per_sec": _rate(len(files), elapsed), "nodes_per_sec": _rate(count, elapsed)}
+    if graph:
+        stages["initiate_graph"]["writes_per_sec"] = _rate(graph.rows_written - rows_before, elapsed)
+
+    # retrieval latency
+    queries = sample_queries(args.files, args.functions, args.queries, args.seed)
+    retrieval._embedder = None
+    samples = []
+    for q in queries:
+        started = time.perf_counter()
+        retrieval.search(q, repo, top_k=args.top_k)
+        samples.append(time.perf_counter() - started)
+    stages["retrieval"] = {"queries": len(samples), **_percentiles(samples)}
+
+    # analyze_impact end to end (retrieval -> traversal -> streamed write-up), cold cache
+    samples = []
+    for q in queries[:args.analyses]:
+        cache.invalidate(repo)
+        started = time.perf_counter()
+        hybridRetriever.analyze_impact(is_fr=True, data=q, top_k=args.top_k, repo=repo, engine="traversal")
+        samples.append(time.perf_counter() - started)
+    stages["analyze_impact"] = {"analyses": len(samples), **_percentiles(samples)}
+
+    result["peak_rss_mb"] = _peak_rss_mb()
+    result["finished"] = datetime.now(timezone.utc).isoformat()
+
+    if args.graph == "neo4j":
+        for name in (repo, pipeline_repo):
+            neo4j_conn.run("MATCH (n) WHERE n.repo = $repo DETACH DELETE n", {"repo": name})
+            neo4j_conn.run("MATCH (r:Repository {name: $repo}) DETACH DELETE r", {"repo": name})
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+# throughputs, higher is better; latencies (*_ms) lower is better
+_HIGHER = "_per_sec"
+
+
+def compare(current: dict, previous: dict):
+    """Print each stage metric next to the same metric of an earlier run."""
+    for stage, metrics in current["stages"].items():
+        before = previous.get("stages", {}).get(stage, {})
+        for key, value in metrics.items():
+            old = before.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old * 100
+            if not key.endswith(_HIGHER) and not key.endswith("_ms"):
+                continue
+            worse = change < 0 if key.endswith(_HIGHER) else change > 0
+            print(f"{stage:20} {key:20} {old:>12} -> {value:>12} ({change:+.1f}%{' worse' if worse else ''})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestion and retrieval benchmarks on a synthetic repo")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=3, help="max directory nesting")
+    parser.add_argument("--mix", default="py:2,js:1,go:1,java:1", help="language weights")
+    parser.add_argument("--functions", type=int, default=6, help="methods and functions per file")
+    parser.add_argument("--calls", type=int, default=3, help="calls per method (call density)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--graph", choices=["memory", "neo4j"], default="memory")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="seconds per embedding request")
+    parser.add_argument("--llm-first-token", type=float, default=0.2)
+    parser.add_argument("--llm-per-token", type=float, default=0.005)
+    parser.add_argument("--llm-tokens", type=int, default=200)
+    parser.add_argument("--upsert-files", type=int, default=20, help="files sent through upsert_code_graph")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--analyses", type=int, default=10)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--out", help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    result = run(args)
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result["stages"], indent=2))
+    print(f"Peak RSS {result['peak_rss_mb']} MB; results written to {out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
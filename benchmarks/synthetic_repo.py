@@ -0,0 +1,158 @@
+from typing import Dict, List
+import os
+import random
+
+# -----------------------------
+# Deterministic synthetic source trees for the benchmarks
+# -----------------------------
+# Same arguments and seed -> byte-identical tree, so runs are comparable.
+
+EXTENSIONS = {"py": ".py", "js": ".js", "go": ".go", "java": ".java"}
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    """"py:3,js:1" -> {"py": 3, "js": 1} (relative weights of each language)."""
+    weights = {}
+    for part in mix.split(","):
+        lang, _, weight = part.strip().partition(":")
+        if lang not in EXTENSIONS:
+            raise Exception(f"Unsupported language {lang!r} (one of {', '.join(EXTENSIONS)})")
+        weights[lang] = int(weight or 1)
+    return weights
+
+
+def _python(mod: Dict, callees: List[List[Dict]]) -> str:
+    imports = sorted({f"from {c['module']} import {c['fn']}" for calls in callees for c in calls
+                      if c["module"] != mod["module"]})
+    lines = imports + ["import os", "", f"LIMIT_{mod['i']} = {mod['i']}", ""]
+    lines += [f"class Service{mod['i']}:", "    def __init__(self):", f"        self.limit = LIMIT_{mod['i']}", ""]
+    for k, calls in enumerate(callees):
+        lines += [f"    def handle_{k}(self, value):", "        total = value + self.limit"]
+        lines += [f"        total = {c['fn']}(total)" for c in calls]
+        lines += ["        return total", ""]
+    for k, calls in enumerate(callees):
+        lines += [f"def {mod['fns'][k]}(value):", "    total = value", "    if total > os.getpid():",
+                  "        total = total - 1"]
+        lines += [f"    total = {c['fn']}(total)" for c in calls[:1]]
+        lines += ["    return total", "", ""]
+    return "\n".join(lines)
+
+
+def _javascript(mod: Dict, callees: List[List[Dict]]) -> str:
+    by_file = {}
+    for calls in callees:
+        for c in calls:
+            if c["path"] != mod["path"]:
+                by_file.setdefault(c["path"], set()).add(c["fn"])
+    here = os.path.dirname(mod["path"])
+    lines = [f'import {{ {", ".join(sorted(fns))} }} from "./{os.path.relpath(path, here)}";'
+             for path, fns in sorted(by_file.items())]
+    lines += ["", f"const LIMIT_{mod['i']} = {mod['i']};", "", f"export class Service{mod['i']} {{",
+              "  constructor() {", f"    this.limit = LIMIT_{mod['i']};", "  }"]
+    for k, calls in enumerate(callees):
+        lines += [f"  handle{k}(value) {{", "    let total = value + this.limit;"]
+        lines += [f"    total = {c['fn']}(total);" for c in calls]
+        lines += ["    return total;", "  }"]
+    lines += ["}", ""]
+    for k, calls in enumerate(callees):
+        lines += [f"export function {mod['fns'][k]}(value) {{", "  let total = value;"]
+        lines += [f"  total = {c['fn']}(total);" for c in calls[:1]]
+        lines += ["  return total;", "}", ""]
+    return "\n".join(lines)
+
+
+def _go(mod: Dict, callees: List[List[Dict]]) -> str:
+    lines = ["package synthetic", "", f"const Limit{mod['i']} = {mod['i']}", "",
+             f"type Service{mod['i']} struct {{", "\tlimit int", "}", ""]
+    for k, calls in enumerate(callees):
+        lines += [f"func (s *Service{mod['i']}) Handle{k}(value int) int {{", "\ttotal := value + s.limit"]
+        lines += [f"\ttotal = {c['fn']}(total)" for c in calls]
+        lines += ["\treturn total", "}", ""]
+    for k, calls in enumerate(callees):
+        lines += [f"func {mod['fns'][k]}(value int) int {{", "\ttotal := value"]
+        lines += [f"\ttotal = {c['fn']}(total)" for c in calls[:1]]
+        lines += ["\treturn total", "}", ""]
+    return "\n".join(lines)
+
+
+def _java(mod: Dict, callees: List[List[Dict]]) -> str:
+    lines = [f"public class Service{mod['i']} {{", f"    static final int LIMIT = {mod['i']};", ""]
+    for k, calls in enumerate(callees):
+        lines += [f"    public int handle{k}(int value) {{", "        int total = value + LIMIT;"]
+        lines += [f"        total = {c['fn']}(total);" for c in calls]
+        lines += ["        return total;", "    }", ""]
+    for k, calls in enumerate(callees):
+        lines += [f"    public static int {mod['fns'][k]}(int value) {{", "        int total = value;"]
+        lines += [f"        total = {c['fn']}(total);" for c in calls[:1]]
+        lines += ["        return total;", "    }", ""]
+    lines.append("}")
+    return "\n".join(lines)
+
+
+RENDERERS = {"py": _python, "js": _javascript, "go": _go, "java": _java}
+
+
+def generate_repo(root: str, files: int = 200, depth: int = 3, mix: str = "py:2,js:1,go:1,java:1",
+                  functions: int = 6, calls: int = 3, seed: int = 0) -> Dict:
+    """
+    Write a synthetic repository of `files` source files under `root`.
+
+    Files are spread over directories nested up to `depth` levels, in the
+    languages of `mix` by weight. Each file holds a class with `functions`
+    methods and as many top-level functions; every method calls `calls`
+    functions picked at random across same-language files (the call
+    density), which Python and JS files import. Returns a summary with the
+    file count, bytes, functions and call sites written.
+    """
+    rng = random.Random(seed)
+    weights = parse_mix(mix)
+    langs = sorted(weights)
+
+    modules = []
+    for i in range(files):
+        lang = rng.choices(langs, [weights[lang] for lang in langs])[0]
+        # up to `depth` directories below src/, three siblings per level
+        dirs = [f"d{level}_{rng.randrange(3)}" for level in range(1, rng.randint(0, depth) + 1)]
+        rel = os.path.join("src", *dirs, f"mod_{i}{EXTENSIONS[lang]}")
+        module = os.path.splitext(rel)[0].replace(os.sep, ".")
+        modules.append({"i": i, "lang": lang, "path": rel.replace(os.sep, "/"), "module": module,
+                        "fns": [f"fn_{i}_{k}" if lang != "go" else f"Fn_{i}_{k}" for k in range(functions)]})
+
+    by_lang = {}
+    for m in modules:
+        by_lang.setdefault(m["lang"], []).append(m)
+
+    summary = {"files": 0, "bytes": 0, "functions": 0, "call_sites": 0, "languages": {}}
+    for m in modules:
+        pool = by_lang[m["lang"]]
+        callees = []
+        for _ in range(functions):
+            picked = []
+            for _ in range(calls):
+                target = rng.choice(pool)
+                fn = rng.choice(target["fns"])
+                if m["lang"] == "java" and target is not m:
+                    fn = f"Service{target['i']}.{fn}"
+                picked.append({"fn": fn, "module": target["module"], "path": target["path"]})
+            callees.append(picked)
+        source = RENDERERS[m["lang"]](m, callees)
+
+        path = os.path.join(root, m["path"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(source)
+        summary["files"] += 1
+        summary["bytes"] += len(source.encode())
+        summary["functions"] += 2 * functions
+        summary["call_sites"] += sum(len(c) for c in callees) + sum(len(c[:1]) for c in callees)
+        summary["languages"][m["lang"]] = summary["languages"].get(m["lang"], 0) + 1
+    return summary
+
+
+def sample_queries(files: int, functions: int, n: int, seed: int = 0) -> List[str]:
+    """Deterministic FR-style query texts naming functions of a generate_repo tree."""
+    rng = random.Random(seed + 1)
+    verbs = ["Validate the input of", "Add retries to", "Log the result of", "Cache the output of",
+             "Rename the limit used by"]
+    return [f"{rng.choice(verbs)} fn_{rng.randrange(files)}_{rng.randrange(functions)} and its callers"
+            for _ in range(n)]
@@ -1,25 +1,34 @@
 import asyncio
 import json
-from fastapi import FastAPI, Request, Depends, WebSocket, BackgroundTasks, Form
+from fastapi import FastAPI, Request, Depends, WebSocket, WebSocketDisconnect, BackgroundTasks, Form, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
+from database import SessionLocal, engine, Base, add_missing_columns
 from models import Repository, AnalysisReport
-from service.utils.repo_utils import clone_repo, list_source_files
+from service.utils.repo_utils import sync_repo
 from service.ingest_repo import initiate_graph
-from service.llm.hybridRetriever import analyze_impact
+from service.llm.hybridRetriever import analyze_impact, analyze_pr
+from service.jobs import AnalysisJobQueue, QueueFull
+from service.metrics import render as render_metrics, recent_spans, span, register_collector
+from service import clients
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 import os
 
 load_dotenv()
 
 LOCAL_PATH=os.getenv("LOCAL_REPO_PATH")
+# Messages buffered per WebSocket; a client that falls this far behind is disconnected
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "1000"))
+# A send taking longer than this marks the connection dead
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
 
 # Init DB
 Base.metadata.create_all(bind=engine)
+add_missing_columns()
 
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
@@ -33,56 +42,251 @@ def get_db():
         db.close()
 
 # --- WebSocket Manager ---
+class Connection:
+    """One dashboard socket: what it subscribed to, and its outgoing queue drained by its own sender task."""
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.repos = set()
+        self.jobs = set()
+        self.everything = False
+        self.queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+        self.sender = None
+
 class ConnectionManager:
+    """
+    Subscription-based fan-out. A connection receives the messages of the
+    repos and jobs it subscribed to ({"action": "subscribe", "repo_id": ..}
+    or "job_id", or ?repo_id= / ?job_id= on /ws). publish() only enqueues,
+    so one slow socket never holds up the others: each connection has a
+    bounded queue and a sender task, and a connection whose queue overflows
+    or whose send fails or times out is closed and dropped. Runs entirely on
+    the server's event loop; worker threads go through broadcast_from_thread.
+    """
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
+        self.connections = set()
+        self.by_repo = {}
+        self.by_job = {}
+        # Latest onboarding progress per repo, replayed to new subscribers
+        self.retained = {}
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket) -> Connection:
         await websocket.accept()
-        self.active_connections.append(websocket)
+        conn = Connection(websocket)
+        self.connections.add(conn)
+        conn.sender = asyncio.create_task(self._send_loop(conn))
+        return conn
+
+    def disconnect(self, conn: Connection):
+        if conn not in self.connections:
+            return
+        self.connections.discard(conn)
+        for repo_id in conn.repos:
+            self._drop(self.by_repo, repo_id, conn)
+        for job_id in conn.jobs:
+            self._drop(self.by_job, job_id, conn)
+        if conn.sender and conn.sender is not asyncio.current_task():
+            conn.sender.cancel()
+
+    def subscribe(self, conn: Connection, repo_id: int = None, job_id: int = None, everything: bool = False):
+        if everything:
+            conn.everything = True
+            for msg in self.retained.values():
+                self._enqueue(conn, msg)
+        if repo_id is not None:
+            conn.repos.add(repo_id)
+            self.by_repo.setdefault(repo_id, set()).add(conn)
+            if repo_id in self.retained:
+                self._enqueue(conn, self.retained[repo_id])
+        if job_id is not None:
+            conn.jobs.add(job_id)
+            self.by_job.setdefault(job_id, set()).add(conn)
+
+    def unsubscribe(self, conn: Connection, repo_id: int = None, job_id: int = None):
+        if repo_id is not None:
+            conn.repos.discard(repo_id)
+            self._drop(self.by_repo, repo_id, conn)
+        if job_id is not None:
+            conn.jobs.discard(job_id)
+            self._drop(self.by_job, job_id, conn)
+
+    @staticmethod
+    def _drop(index: dict, key, conn: Connection):
+        subscribers = index.get(key)
+        if subscribers is not None:
+            subscribers.discard(conn)
+            if not subscribers:
+                del index[key]
+
+    def publish(self, msg: dict, retain: bool = None):
+        """
+        Queue `msg` for every connection subscribed to its repo_id or job_id.
+        retain=True keeps it as the repo's latest progress (sent to later
+        subscribers), retain=False clears that.
+        """
+        repo_id, job_id = msg.get("repo_id"), msg.get("job_id")
+        text = json.dumps(msg, default=str)
+        if retain:
+            self.retained[repo_id] = text
+        elif retain is False:
+            self.retained.pop(repo_id, None)
+        targets = set(self.by_repo.get(repo_id, ())) | set(self.by_job.get(job_id, ()))
+        targets |= {c for c in self.connections if c.everything}
+        for conn in targets:
+            self._enqueue(conn, text)
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+    def _enqueue(self, conn: Connection, text: str):
+        try:
+            conn.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            print(f"WebSocket client fell {WS_QUEUE_SIZE} messages behind; disconnecting it")
+            self.disconnect(conn)
+            asyncio.create_task(self._close(conn, 1013))
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+    async def _send_loop(self, conn: Connection):
+        try:
+            while True:
+                text = await conn.queue.get()
+                await asyncio.wait_for(conn.websocket.send_text(text), WS_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # closed, broken or stuck socket
+            self.disconnect(conn)
+            await self._close(conn, 1011)
+
+    async def _close(self, conn: Connection, code: int):
+        try:
+            await asyncio.wait_for(conn.websocket.close(code=code), WS_SEND_TIMEOUT)
+        except Exception:
+            pass
 
 manager = ConnectionManager()
 
+register_collector(
+    "impact_ws_connections", "gauge", "Open dashboard WebSocket connections",
+    lambda: {(): len(manager.connections)},
+)
+
+# Event loop of the server, so worker threads can hand messages back to it
+event_loop = None
+
+@app.on_event("startup")
+async def capture_event_loop():
+    global event_loop
+    event_loop = asyncio.get_running_loop()
+
+@app.on_event("startup")
+def start_job_lease():
+    # renews this worker's jobs and fails those of workers that died
+    jobs.start()
+
+@app.on_event("shutdown")
+def close_clients():
+    jobs.stop()
+    # Neo4j driver, MCP pool and embedding cache, whichever were used
+    clients.close_all()
+
 # --- Simulation Logic ---
+# Repos with a sync/ingestion task in flight; two on the same clone would race on git and the graph
+syncing_repos = set()
+
 async def simulate_pipeline(repo_id: int):
-    """Simulates cloning, linting, and dependency checking."""
+    """Clones (or fetches and updates) the repo at its pinned ref, then ingests the synced commit."""
+    syncing_repos.add(repo_id)
+    try:
+        await _sync_and_ingest(repo_id)
+    finally:
+        syncing_repos.discard(repo_id)
+
+async def _sync_and_ingest(repo_id: int):
     steps = ["Cloning Repository...", "Embedding Codebase...", "Onboarding Complete"]
     # 1. Create a NEW session manually
     db = SessionLocal()
     repo = db.query(Repository).filter(Repository.id == repo_id).first()
     print("Simulating pipeline for repo:", LOCAL_PATH+repo.name,repo.url)
-    msg = json.dumps({"repo_id": repo_id, "status": steps[0], "progress": True})
-    await manager.broadcast(msg)
-    # 2. Clone the repo
-    clone_repo(repo.url,LOCAL_PATH+repo.name)
-    msg = json.dumps({"repo_id": repo_id, "status": steps[1], "progress": False})
-
-    #3. Embed Codebase
-    initiate_graph(repo.name)
-    msg = json.dumps({"repo_id": repo_id, "status": steps[2], "progress": False})
-    await manager.broadcast(msg)
-
-
-async def simulate_impact_analysis(repo_id: int, type_param: str,data: str):
-    """Simulates calculating impact."""\
-    # await manager.broadcast(json.dumps({"status": f"Analyzing {type_param}...", "repo_id": repo_id}))
-    analyze_impact_result = analyze_impact(is_fr=(type_param=='FR'),data="Sample data for analysis",top_k=20)
-    result = analyze_impact_result
-    # result = {
-    #     "files_changed": ["api/auth.py", "core/config.py"],
-    #     "risk_level": "High",
-    #     "affected_services": ["UserAuth", "Billing"],
-    #     "status": "Report Ready"
-    # }
-    await manager.broadcast(json.dumps({"repo_id": repo_id, "report": result, "type":"readme"}))
-    print("Impact analysis completed for repo:", repo_id,result)
+    manager.publish({"repo_id": repo_id, "status": steps[0], "progress": True}, retain=True)
+
+    def on_progress(counts: dict):
+        broadcast_from_thread({"repo_id": repo_id, "status": steps[1], "event": "progress", "progress": True,
+                               **counts}, retain=True)
+
+    try:
+        # 2. Sync the clone (blocking git/ingestion work runs off the event loop)
+        with span("sync", repo=repo.name):
+            commit = await asyncio.to_thread(sync_repo, repo.url, LOCAL_PATH+repo.name, repo.ref)
+        manager.publish({"repo_id": repo_id, "status": steps[1], "commit": commit, "progress": True}, retain=True)
+
+        #3. Embed Codebase (incremental against the last ingested commit)
+        failed = await asyncio.to_thread(initiate_graph, repo.name, commit=commit, on_progress=on_progress)
+    except Exception as e:
+        repo.status = "Failed"
+        db.commit()
+        db.close()
+        # do not leave the last progress step to be replayed to new subscribers
+        manager.publish({"repo_id": repo_id, "status": "Onboarding failed", "error": str(e), "progress": True},
+                        retain=False)
+        raise
+    repo.commit = commit
+    if failed:
+        # Part of the graph is missing or stale; the next sync retries those files
+        repo.status = "Incomplete"
+        db.commit()
+        db.close()
+        manager.publish({"repo_id": repo_id, "status": f"Onboarding incomplete: {len(failed)} files failed",
+                         "progress": True, "failed": [f for f, _ in failed][:50]}, retain=False)
+        return
+    repo.status = "Onboarded"
+    db.commit()
+    db.close()
+    manager.publish({"repo_id": repo_id, "status": steps[2], "progress": True}, retain=False)
+
+
+# --- Impact analysis jobs ---
+def broadcast_from_thread(msg: dict, retain: bool = None):
+    """Hands a message to the manager on the server's event loop from a worker thread (in call order)."""
+    if event_loop is not None:
+        event_loop.call_soon_threadsafe(manager.publish, msg, retain)
+
+def run_analysis(repo_id: int, type_: str, data: str, job_id: int, path_prefix: str = None,
+                 semantic_types: list = None, base_ref: str = None, head_ref: str = None, write_up: bool = True):
+    """
+    Runs on an analysis worker thread; stage, retrieval and token events are streamed over /ws.
+    FR retrieval is scoped to the repo (and to path_prefix / semantic_types when given);
+    a PR is analysed from its diff against the local clone.
+    """
+    db = SessionLocal()
+    try:
+        repo = db.query(Repository).filter(Repository.id == repo_id).first()
+    finally:
+        db.close()
+
+    def on_event(event: dict):
+        broadcast_from_thread({"repo_id": repo_id, "job_id": job_id, **event})
+
+    if repo is None:
+        raise Exception(f"Repository {repo_id} not found")
+    with span("analysis", repo=repo.name, job_id=job_id, type=type_):
+        if type_ == "PR":
+            result = analyze_pr(data, repo.name, LOCAL_PATH+repo.name, base_ref=base_ref, head_ref=head_ref,
+                                write_up=write_up, on_event=on_event)
+            print("PR impact analysis completed for repo:", repo_id, "job:", job_id)
+            return result
+        result = analyze_impact(is_fr=(type_ == 'FR'), data=data, top_k=20, repo=repo.name, on_event=on_event,
+                                path_prefix=path_prefix, semantic_types=semantic_types)
+    print("Impact analysis completed for repo:", repo_id, "job:", job_id)
+    return result
+
+def publish_job_event(job_id: int, repo_id: int, status: str, result=None):
+    """Called from worker threads on every job status change."""
+    if status == "Done":
+        msg = {"repo_id": repo_id, "job_id": job_id, "event": "report", "report": result, "type": "readme"}
+    else:
+        msg = {"repo_id": repo_id, "job_id": job_id, "job_status": status}
+        if status == "Failed":
+            msg["error"] = result
+    broadcast_from_thread(msg)
+
+jobs = AnalysisJobQueue(run_analysis, on_event=publish_job_event)
 
 # --- Routes ---
 
@@ -92,23 +296,42 @@ def dashboard(request: Request, db: Session = Depends(get_db)):
     return templates.TemplateResponse("dashboard.html", {"request": request, "repos": repos})
 
 @app.post("/onboard")
-async def onboard_repo(background_tasks: BackgroundTasks, url: str = Form(...), db: Session = Depends(get_db)):
+async def onboard_repo(background_tasks: BackgroundTasks, url: str = Form(...), ref: Optional[str] = Form(None),
+                       db: Session = Depends(get_db)):
     # 1. Create Repo Entry
     repo_name = url.split("/")[-1].replace(".git", "")
     hasrepo=db.query(Repository).filter(Repository.name == repo_name).first()
     if hasrepo:
         return {"message": "Repo already exists", "repo_id": hasrepo.id}
     else:
-        new_repo = Repository(name=repo_name, url=url, status="Onboarding")
+        new_repo = Repository(name=repo_name, url=url, ref=ref or None, status="Onboarding")
         db.add(new_repo)
         db.commit()
         db.refresh(new_repo)
         
         # 2. Trigger Pipeline in Background
+        syncing_repos.add(new_repo.id)
         background_tasks.add_task(simulate_pipeline, new_repo.id)
         
         return {"message": "Onboarding started", "repo_id": new_repo.id}
 
+@app.post("/repo/{repo_id}/sync")
+async def sync_repo_route(repo_id: int, background_tasks: BackgroundTasks, ref: Optional[str] = Form(None),
+                          db: Session = Depends(get_db)):
+    """Fetch the repo's new commits (or move it to `ref`) and re-ingest what changed."""
+    repo = db.query(Repository).filter(Repository.id == repo_id).first()
+    if not repo:
+        raise HTTPException(status_code=404, detail="Unknown repository.")
+    if repo.id in syncing_repos:
+        raise HTTPException(status_code=409, detail="A sync or onboarding of this repository is already running.")
+    syncing_repos.add(repo.id)
+    if ref is not None:
+        repo.ref = ref or None
+    repo.status = "Syncing"
+    db.commit()
+    background_tasks.add_task(simulate_pipeline, repo.id)
+    return {"message": "Sync started", "repo_id": repo.id, "ref": repo.ref}
+
 @app.get("/repo/{repo_id}")
 def repo_detail(request: Request, repo_id: int, db: Session = Depends(get_db)):
     repo = db.query(Repository).filter(Repository.id == repo_id).first()
@@ -127,45 +350,108 @@ class AnalysisRequest(BaseModel):
     type: str # 'FR' or 'PR'
     fr_data: Optional[str] = None # Functional Requirements text
     pr_id: Optional[str] = None # Pull Request ID
+    path_prefix: Optional[str] = None # only retrieve from files under this repo-relative path
+    semantic_types: Optional[List[str]] = None # e.g. ["function", "class_or_type"]
+    base_ref: Optional[str] = None # PR base; defaults to the commit the graph was ingested at
+    head_ref: Optional[str] = None # PR head; defaults to the PR's head ref fetched from origin
+    write_up: bool = True # False: return the computed PR impact set without the LLM report (CI gates)
 
 @app.post("/analyze/{repo_id}")
-async def analyze_repo(background_tasks: BackgroundTasks, repo_id: str, request: AnalysisRequest):
-    # Retrieve repository details (e.g., connection details, API key) based on repo_id
-    # repo = get_repo_details(repo_id) 
+async def analyze_repo(repo_id: int, request: AnalysisRequest, db: Session = Depends(get_db)):
+    # Retrieval is scoped to this repo, so it has to exist
+    repo = db.query(Repository).filter(Repository.id == repo_id).first()
+    if not repo:
+        raise HTTPException(status_code=404, detail="Unknown repository.")
 
     if request.type == "FR":
         # 1. Functional Requirements Analysis
         if not request.fr_data:
             raise HTTPException(status_code=400, detail="Missing FR data for FR analysis.")
         
-        # Call your core analysis service with the provided FR text
-        # analyze_impact(repo_id, type="FR", data=request.fr_data)
-        background_tasks.add_task(simulate_impact_analysis, repo_id, request.type,request.fr_data)
-        # Start the WebSocket process (assuming your service handles it)
-        print(f"Starting FR analysis for repo {repo_id} with data: {request.fr_data[:50]}...")
-        return {"message": "FR analysis initiated."}
+        # Queue the analysis; the report is pushed over the WebSocket when it is done
+        try:
+            job_id = jobs.submit(repo_id, request.type, request.fr_data,
+                                 path_prefix=request.path_prefix, semantic_types=request.semantic_types)
+        except QueueFull as e:
+            raise HTTPException(status_code=429, detail=f"Analysis queue is full: {e}")
+        print(f"Queued FR analysis job {job_id} for repo {repo_id} with data: {request.fr_data[:50]}...")
+        return {"message": "FR analysis initiated.", "job_id": job_id}
 
     elif request.type == "PR":
         # 2. Pull Request Analysis
-        if not request.pr_id:
-            raise HTTPException(status_code=400, detail="Missing PR ID for PR analysis.")
-
-        # For PR, the backend is responsible for:
-        # a. Calling the Git provider API (e.g., GitHub, GitLab) using repo_id and request.pr_id.
-        # b. Fetching the branch name and the actual diff/files changed data.
-        # c. analyze_impact(repo_id, type="PR", data=request.pr_id) # The service will fetch content
+        if not request.pr_id and not request.head_ref:
+            raise HTTPException(status_code=400, detail="Missing PR ID or head ref for PR analysis.")
 
-        print(f"Starting PR analysis for repo {repo_id}, PR #{request.pr_id}. Backend will fetch PR content.")
-        return {"message": "PR analysis initiated."}
+        # The diff is computed in the local clone and mapped onto the graph; no retrieval stage
+        try:
+            job_id = jobs.submit(repo_id, request.type, request.pr_id or request.head_ref,
+                                 base_ref=request.base_ref, head_ref=request.head_ref, write_up=request.write_up)
+        except QueueFull as e:
+            raise HTTPException(status_code=429, detail=f"Analysis queue is full: {e}")
+        print(f"Queued PR analysis job {job_id} for repo {repo_id}, PR {request.pr_id or request.head_ref}")
+        return {"message": "PR analysis initiated.", "job_id": job_id}
 
     else:
         raise HTTPException(status_code=400, detail="Invalid analysis type.")
 
+@app.get("/jobs/{job_id}")
+def job_status(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(AnalysisReport).filter(AnalysisReport.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Unknown job.")
+    return {
+        "job_id": job.id,
+        "repo_id": job.repo_id,
+        "type": job.type,
+        "status": job.status,
+        "report": job.content,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "queue_depth": jobs.depth(),
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint: stage latencies, per-file sizes, Neo4j, LLM, cache and queue metrics."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+def traces(limit: int = 100, repo: Optional[str] = None):
+    """Most recent finished spans (stage, tags, duration), newest first."""
+    return recent_spans(limit, **({"repo": repo} if repo else {}))
+
+def _int_param(value):
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    """
+    Dashboard event stream. Subscribe with ?repo_id= / ?job_id= or by
+    sending {"action": "subscribe" | "unsubscribe", "repo_id": .., "job_id": ..}
+    ({"action": "subscribe", "all": true} for every repo's events).
+    """
+    conn = await manager.connect(websocket)
+    manager.subscribe(conn, repo_id=_int_param(websocket.query_params.get("repo_id")),
+                      job_id=_int_param(websocket.query_params.get("job_id")))
     try:
         while True:
-            await websocket.receive_text()
-    except:
-        manager.disconnect(websocket)
\ No newline at end of file
+            try:
+                request = json.loads(await websocket.receive_text())
+            except ValueError:
+                continue
+            if not isinstance(request, dict):
+                continue
+            repo_id, job_id = _int_param(request.get("repo_id")), _int_param(request.get("job_id"))
+            if request.get("action") == "subscribe":
+                manager.subscribe(conn, repo_id=repo_id, job_id=job_id, everything=bool(request.get("all")))
+            elif request.get("action") == "unsubscribe":
+                manager.unsubscribe(conn, repo_id=repo_id, job_id=job_id)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(conn)
\ No newline at end of file
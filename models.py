@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -8,6 +8,8 @@ class Repository(Base):
     name = Column(String, index=True)
     url = Column(String)
     status = Column(String, default="Pending") # Pending, Onboarded
+    ref = Column(String) # branch, tag or commit to pin to; None follows the default branch
+    commit = Column(String) # commit last synced and ingested
 
 class AnalysisReport(Base):
     __tablename__ = "reports"
@@ -15,4 +17,13 @@ class AnalysisReport(Base):
     repo_id = Column(Integer, ForeignKey("repositories.id"))
     type = Column(String) # 'FR' or 'PR'
     content = Column(Text) # JSON string or text summary
-    impact_score = Column(Integer)
\ No newline at end of file
+    impact_score = Column(Integer)
+    # Analysis job state
+    status = Column(String, default="Queued", index=True) # Queued, Running, Done, Failed
+    input = Column(Text) # FR text or PR reference
+    error = Column(Text)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    owner = Column(String) # server process running the job
+    heartbeat_at = Column(DateTime) # last time the owner renewed its claim on the job
@@ -1,35 +1,23 @@
-from neo4j import GraphDatabase
 from dotenv import load_dotenv
-import os
+from service.graph.neo4j_conn import create_vector_indexes, EMBEDDING_STORAGE
+from service.graph.migrations import (migrate_node_ids, drop_legacy_fulltext_indexes, remove_zero_embeddings,
+                                      convert_embeddings_to_float32, allow_float64_embeddings)
 
 load_dotenv()
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USERNAME =  os.getenv("NEO4J_USERNAME")
-NEO4J_PASSWORD =  os.getenv("NEO4J_PASSWORD")
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+create_vector_indexes()
 
-def run(query, params=None):
-    with driver.session() as session:
-        session.run(query, params or {})
+# Graphs ingested before the compact ID scheme still use path-string IDs
+migrate_node_ids()
 
-def create_vector_indexes():
-    run("DROP INDEX astVectorIndex IF EXISTS;")
-    run("""
-        CREATE VECTOR INDEX astVectorIndex IF NOT EXISTS
-        FOR (n:AstNode) ON (n.embedding)
-        OPTIONS {
-        indexConfig: {
-            `vector.dimensions`: 768,
-            `vector.similarity_function`: "cosine"
-        }
-        };
-    """)
-    # Fulltext index
-    run("""
-        CREATE FULLTEXT INDEX astFulltextIndex IF NOT EXISTS
-        FOR (n:AstNode) ON EACH [n.text, n.name, n.semantic_type]
-    """)
-    print("✔ Vector + fulltext indexes ready.")
+# Retrieval now uses the repo-scoped symbol fulltext index
+drop_legacy_fulltext_indexes()
 
-create_vector_indexes()
\ No newline at end of file
+# Nodes that were never meant to be embedded still carry all-zero vectors
+remove_zero_embeddings()
+
+# Embeddings written before EMBEDDING_STORAGE=float32 are 64-bit lists
+if EMBEDDING_STORAGE == "float32":
+    convert_embeddings_to_float32()
+else:
+    allow_float64_embeddings()
@@ -0,0 +1,58 @@
+from typing import Any, Callable, Dict
+import threading
+
+# -----------------------------
+# LAZY CLIENT REGISTRY
+# -----------------------------
+# Modules register how to build their external clients (Neo4j driver, Ollama
+# clients, MCP pool, embedding cache) and fetch them with get(); nothing is
+# connected or opened at import time, and every caller shares one instance.
+
+_factories: Dict[str, Callable[[], Any]] = {}
+_closers: Dict[str, Callable[[Any], None]] = {}
+_instances: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def register(name: str, factory: Callable[[], Any], close: Callable[[Any], None] = None):
+    """Declare how to build client `name` on first use (and how to close it on shutdown)."""
+    _factories[name] = factory
+    if close:
+        _closers[name] = close
+
+
+def get(name: str):
+    """The shared instance of client `name`, built on first call."""
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _lock:
+        if name not in _instances:
+            _instances[name] = _factories[name]()
+        return _instances[name]
+
+
+def peek(name: str):
+    """The instance if it has been built already, else None (never builds it)."""
+    return _instances.get(name)
+
+
+def override(name: str, instance):
+    """Use `instance` as client `name` from now on (benchmarks, local stubs)."""
+    with _lock:
+        _instances[name] = instance
+
+
+def close_all():
+    """Close every client built so far; the next get() builds a fresh one."""
+    with _lock:
+        built = list(_instances.items())
+        _instances.clear()
+    for name, instance in built:
+        closer = _closers.get(name)
+        if closer is None:
+            continue
+        try:
+            closer(instance)
+        except Exception as e:
+            print(f"Closing {name} failed: {e}")
@@ -1,17 +1,70 @@
 
 
-# Utility functions from original file (kept for context)
-def make_nid(file_path, node):
+import hashlib
+import struct
+
+def _hash64(data: bytes) -> int:
+    # signed so it fits Neo4j's 64-bit integer properties
+    return struct.unpack("<q", hashlib.blake2b(data, digest_size=8).digest())[0]
+
+def file_id(repo_name, rel_path):
+    """
+    Fixed-width integer ID of a file, derived from the repo name and the
+    repo-relative path so it is identical on every machine and clone location.
+    """
+    return _hash64(f"{repo_name}\0{rel_path}".encode())
+
+def make_nid(fid, node):
+    """
+    64-bit node ID from the file ID plus the node's byte span and type. The
+    type is part of the key because a parent and its only child often cover
+    the same bytes (e.g. expression_statement -> call).
+    """
     if node is None:
         return None
-    # Use start/end *point* (line:column) for better uniqueness and readability,
-    # though byte offsets are used here for simplicity as in the original.
-    return f"{file_path}:{node.start_byte}:{node.end_byte}"
+    return node_id(fid, node.start_byte, node.end_byte, node.type)
 
-def get_text(node, source):
+def node_id(fid, start_byte, end_byte, node_type):
+    return _hash64(struct.pack("<qII", fid, start_byte, end_byte) + node_type.encode())
+
+def get_text(node, source, max_len=None):
     if node is None:
         return None
-    return source[node.start_byte:node.end_byte].decode(errors="ignore")
+    end = node.end_byte
+    if max_len is not None:
+        # utf-8 is at most 4 bytes per char; avoid decoding a whole file just to keep a prefix
+        end = min(end, node.start_byte + 4 * max_len)
+        return source[node.start_byte:end].decode(errors="ignore")[:max_len]
+    return source[node.start_byte:end].decode(errors="ignore")
+
+def iter_nodes(tree, skip_anonymous=False):
+    """
+    Pre-order traversal of a tree-sitter tree, yielding (node, parent) pairs.
+
+    Driven by a TreeCursor, so Python stack depth stays constant however deep
+    the tree is and no per-level `children` lists are built. With
+    skip_anonymous, unnamed nodes (punctuation, keywords, operators) are not
+    yielded and their named descendants are reported under the nearest
+    yielded ancestor, so parent/child links stay connected.
+    """
+    cursor = tree.walk()
+    # nearest yielded ancestor for nodes at each cursor depth
+    parents = [None]
+    while True:
+        node = cursor.node
+        parent = parents[-1]
+        emitted = node.is_named or not skip_anonymous
+        if emitted:
+            yield node, parent
+
+        if cursor.goto_first_child():
+            parents.append(node if emitted else parent)
+            continue
+
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return
+            parents.pop()
 
 def extract_semantics(node, source):
     """
@@ -193,7 +246,7 @@ def extract_semantics(node, source):
     # --------------------------
     # IMPORT / USE (Cross-File)
     # --------------------------
-    if t in ("import_statement", "use_declaration", "namespace_import", "import_declaration"):
+    if t in ("import_statement", "import_from_statement", "use_declaration", "namespace_import", "import_declaration"):
         # For DFG/Call Graph resolution outside the file
         return {"semantic_type": "import_statement"}
 
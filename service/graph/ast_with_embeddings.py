@@ -1,21 +1,18 @@
-import asyncio
-from neo4j import GraphDatabase
 from typing import Dict, List
-from .ast_util import extract_semantics, make_nid, get_text
-import ollama
-from .neo4j_conn import run
-from neo4j_graphrag.embeddings import OllamaEmbeddings
+from .ast_util import extract_semantics, make_nid, file_id, get_text, iter_nodes
+from .symbol_graph import SYMBOL_KINDS
+from . import source_store
+from .neo4j_conn import run, query
+from .embeddings import attach_embeddings
+from .graph_writer import GraphWriter
+from dotenv import load_dotenv
+import os
 
-# -----------------------------
-# EMBEDDING MODEL
-# -----------------------------
-embedder = OllamaEmbeddings(model="nomic-embed-text")
+load_dotenv()
+
+# Drop punctuation / keyword tokens from the graph (their named children are kept)
+SKIP_ANONYMOUS = os.getenv("INGEST_SKIP_ANONYMOUS", "true").lower() in ("1", "true", "yes")
 
-def embed(text: str) -> List[float]:
-    if not text:
-        return [0.0] * 768
-    embedding = embedder.embed_query(text)
-    return embedding
 
 IMPORTANT_SEM_TYPES = {
     # Core semantic anchors
@@ -66,37 +63,54 @@ def should_embed(node_type: str, sem: Dict):
 # -----------------------------
 # MAIN UPSERT PIPELINE
 # -----------------------------
-def upsert_code_graph(repo_name: str, file_path: str, tree, source):
+def collect_code_graph(repo_name: str, file_path: str, tree, source, content_hash: str = None,
+                       skip_anonymous: bool = None) -> Dict:
     """
-    1. Create repository + file metadata node
-    2. Walk AST and collect nodes
-    3. Generate embeddings
-    4. Build semantic edges
-    5. Bulk upsert to Neo4j
+    Walk the AST of one file and return plain node / edge records.
+    `file_path` is relative to the repository root.
+
+    Pure CPU work with no I/O, so it can run in a worker process; the
+    result is picklable and is what the embedding and writer stages consume.
+    Source text is not copied onto nodes: they keep their byte range into
+    the file revision, which lives once in the source store (source_store),
+    and only import statements keep their text for call / import resolution.
+    Nodes carry their embedding input as `emb_text` until attach_embeddings
+    resolves it. skip_anonymous defaults to INGEST_SKIP_ANONYMOUS.
+
+    Alongside the AST it collects the file's symbol layer: one record per
+    named function / class (keyed by its AST node id, with the enclosing
+    symbol as `parent`) and the distinct variables each symbol, or the
+    module scope (scope None), defines and uses. Call sites carry their
+    enclosing symbol as `scope` so calls can be aggregated per symbol.
     """
+    if skip_anonymous is None:
+        skip_anonymous = SKIP_ANONYMOUS
 
     # Nodes & relationships aggregated here
     nodes = []
     rel_child = []
-    rel_calls = []
     rel_def = []
     rel_use = []
-    rel_repo_file = []
-    rel_file_root = []
+    symbols = []
+    sym_defines = set()
+    sym_uses = set()
+    # AST node id -> innermost enclosing symbol (itself for a definition)
+    scope_of = {}
 
-    root = tree.root_node
-    root_id = make_nid(file_path, root)
+    fid = file_id(repo_name, file_path)
+    root_id = make_nid(fid, tree.root_node)
 
     # -----------------------------
     # Traverse AST
     # -----------------------------
-    def walk(node, parent_id=None):
-        nid = make_nid(file_path, node)
-        if nid is None:
-            return
+    for node, parent in iter_nodes(tree, skip_anonymous):
+        nid = make_nid(fid, node)
+        parent_id = make_nid(fid, parent)
 
-        text = get_text(node, source)
+        text = get_text(node, source, max_len=250)
         sem = extract_semantics(node, source)
+        st = sem.get("semantic_type")
+        scope = scope_of.get(parent_id)
 
         # Embedding input
         emb_text = f"{node.type} | {sem.get('semantic_type')} | {text[:10]}"
@@ -106,121 +120,153 @@ def upsert_code_graph(repo_name: str, file_path: str, tree, source):
         nodes.append({
             "id": nid,
             "type": node.type,
-            "text": text[:250],
-            "semantic_type": sem.get("semantic_type"),
+            "text": text if st == "import_statement" else None,
+            "start_byte": node.start_byte,
+            "end_byte": node.end_byte,
+            "semantic_type": st,
             "name": sem.get("name"),
             "file": file_path,
             "repo": repo_name,
-            "embedding": embed(emb_text),
+            # call sites keep the callee name for the deferred CALLS resolution pass
+            "callee": sem.get("function_name") if st == "call" else None,
+            "scope": scope if st == "call" else None,
+            "emb_text": emb_text,
         })
 
-        if parent_id:
+        if st in SYMBOL_KINDS and sem.get("name"):
+            symbols.append({
+                "id": nid,
+                "kind": SYMBOL_KINDS[st],
+                "name": sem.get("name"),
+                "parent": scope,
+                "fid": fid,
+                "file": file_path,
+                "repo": repo_name,
+                # first line of the definition, for the symbol fulltext index
+                "signature": text.split("\n", 1)[0].strip()[:200],
+                "start_line": node.start_point[0] + 1,
+                "end_line": node.end_point[0] + 1,
+            })
+            scope_of[nid] = nid
+        else:
+            scope_of[nid] = scope
+
+        if parent_id is not None:
             rel_child.append({"parent": parent_id, "child": nid})
 
-        # CALL edges
-        if sem.get("semantic_type") == "call":
-            fn = sem.get("function_name")
-            if fn:
-                rel_calls.append({"caller": nid, "callee_name": fn})
-
         # DEF edges
-        if sem.get("semantic_type") == "assignment":
+        if st == "assignment":
             target = sem.get("target_name")
             if target:
                 rel_def.append({"node": nid, "var": target})
+                sym_defines.add((scope, target))
 
         # USE edges
-        if sem.get("semantic_type") == "identifier_use":
+        if st == "identifier_use":
             name = sem.get("name")
             if name:
                 rel_use.append({"node": nid, "var": name})
+                sym_uses.add((scope, name))
+
+    return {
+        "repo": repo_name,
+        "file": file_path,
+        "fid": fid,
+        "hash": content_hash,
+        "root": root_id,
+        "nodes": nodes,
+        "child": rel_child,
+        "defs": rel_def,
+        "uses": rel_use,
+        "symbols": symbols,
+        "sym_defines": [{"scope": sc, "fid": fid, "var": v} for sc, v in sorted(sym_defines, key=str)],
+        "sym_uses": [{"scope": sc, "fid": fid, "var": v} for sc, v in sorted(sym_uses, key=str)],
+    }
+
+
+def write_code_graph(records: Dict):
+    """Upsert one file's records (as built by collect_code_graph) in a single write transaction."""
+    writer = GraphWriter()
+    writer.add(records)
+    writer.flush()
+
+
+def upsert_code_graph(repo_name: str, file_path: str, tree, source, content_hash: str = None):
+    """
+    1. Walk AST and collect nodes + semantic edges (file_path relative to the repo root)
+    2. Generate embeddings (batched + deduplicated, only for should_embed nodes)
+    3. Keep the file's source in the source store, keyed by its content hash
+    4. Bulk upsert repo/file metadata (with the content hash used for incremental runs) and the AST to Neo4j
+    """
+    content_hash = content_hash or source_store.content_hash(source)
+    records = collect_code_graph(repo_name, file_path, tree, source, content_hash)
+    source_store.put(content_hash, source)
+    embedded = attach_embeddings(records["nodes"])
+    print(f"Collected {len(records['nodes'])} AST nodes ({embedded} embedded) from {file_path} in repo {repo_name}")
+    write_code_graph(records)
 
-        for c in node.children:
-            walk(c, nid)
-
-    # Start traversal
-    walk(root)
 
-    # -----------------------------
-    # Pre-build repo → file links
-    # -----------------------------
-    rel_repo_file.append({"repo": repo_name, "file": file_path})
-
-    # File → AST root
-    rel_file_root.append({"file": file_path, "root": root_id})
+# -----------------------------
+# INCREMENTAL INGESTION HELPERS
+# -----------------------------
+def get_file_hashes(repo_name: str) -> Dict[str, str]:
+    """Content hash of every File node already ingested for the repo, keyed by repo-relative path."""
+    rows = query("""
+        MATCH (f:File {repo: $repo})
+        RETURN f.path AS path, f.content_hash AS hash
+    """, {"repo": repo_name})
+    return {r["path"]: r["hash"] for r in rows}
 
-    print(f"Collected {len(nodes)} AST nodes from {file_path} in repo {repo_name}")
 
-    # -----------------------------
-    # EXECUTE BULK UPSERTS
-    # -----------------------------
-    run("""
-        MERGE (:Repository {name: $repo})
+def get_last_commit(repo_name: str):
+    rows = query("""
+        MATCH (r:Repository {name: $repo})
+        RETURN r.last_commit AS commit
     """, {"repo": repo_name})
+    return rows[0]["commit"] if rows else None
 
-    # 2. Upsert File Node
-    run("""
-        MERGE (f:File {path: $file, repo: $repo})
-        SET f.updatedAt = timestamp()
-    """, {"file": file_path, "repo": repo_name})
 
-    # 3. Repo → File edge
+def set_last_commit(repo_name: str, commit: str):
+    """
+    Record a finished ingestion. `version` goes up on every run so caches
+    keyed on the graph version (see get_graph_version) invalidate themselves.
+    """
     run("""
-        MATCH (r:Repository {name: $repo})
-        MATCH (f:File {path: $file})
-        MERGE (r)-[:HAS_FILE]->(f)
-    """, {"repo": repo_name, "file": file_path})
+        MERGE (r:Repository {name: $repo})
+        SET r.last_commit = coalesce($commit, r.last_commit),
+            r.version = coalesce(r.version, 0) + 1,
+            r.ingestedAt = timestamp()
+    """, {"repo": repo_name, "commit": commit})
 
-    # 4. Upsert AST nodes
-    run("""
-        UNWIND $nodes AS n
-        MERGE (a:AstNode {id: n.id})
-        SET a.type = n.type,
-            a.text = n.text,
-            a.semantic_type = n.semantic_type,
-            a.name = n.name,
-            a.file = n.file,
-            a.repo = n.repo,
-            a.embedding = n.embedding
-    """, {"nodes": nodes})
-
-    # 5. File → Root AST
-    run("""
-        MATCH (f:File {path: $file})
-        MATCH (r:AstNode {id: $root})
-        MERGE (f)-[:HAS_AST_ROOT]->(r)
-    """, {"file": file_path, "root": root_id})
 
-    # 6. AST child edges
-    run("""
-        UNWIND $rels AS r
-        MATCH (p:AstNode {id:r.parent})
-        MATCH (c:AstNode {id:r.child})
-        MERGE (p)-[:CHILD]->(c)
-    """, {"rels": rel_child})
+def get_graph_version(repo_name: str) -> str:
+    rows = query("""
+        MATCH (r:Repository {name: $repo})
+        RETURN r.version AS version, r.last_commit AS commit
+    """, {"repo": repo_name})
+    if not rows:
+        return None
+    return f"{rows[0]['version'] or 0}:{rows[0]['commit']}"
 
-    # 7. CALL edges
-    run("""
-        UNWIND $calls AS row
-        MATCH (caller:AstNode {id: row.caller})
-        MATCH (callee:AstNode {name: row.callee_name})
-        MERGE (caller)-[:CALLS]->(callee)
-    """, {"calls": rel_calls})
 
-    # 8. DEF edges
+def remove_file_graph(repo_name: str, file_path: str, delete_file: bool = False):
+    """
+    Drop the AstNode subgraph (and with it every CHILD/CALLS/DEF/USE edge
+    touching it) and the Function / Class symbols of one file. With
+    delete_file the File node goes too, which is what a file deleted from
+    the repo needs.
+    """
     run("""
-        UNWIND $defs AS row
-        MATCH (n:AstNode {id: row.node})
-        MERGE (v:Variable {name: row.var})
-        MERGE (n)-[:DEF]->(v)
-    """, {"defs": rel_def})
-
-    # 9. USE edges
+        MATCH (n:AstNode {repo: $repo, file: $file})
+        CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+    """, {"repo": repo_name, "file": file_path})
     run("""
-        UNWIND $uses AS row
-        MATCH (n:AstNode {id: row.node})
-        MERGE (v:Variable {name: row.var})
-        MERGE (n)-[:USE]->(v)
-    """, {"uses": rel_use})
+        MATCH (s:Symbol {repo: $repo, file: $file})
+        DETACH DELETE s
+    """, {"repo": repo_name, "file": file_path})
 
-    print(f"✔ AST + Repo/File upsert complete for repo={repo_name}, file={file_path}")
+    if delete_file:
+        run("""
+            MATCH (f:File {fid: $fid})
+            DETACH DELETE f
+        """, {"fid": file_id(repo_name, file_path)})
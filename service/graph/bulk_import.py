@@ -0,0 +1,179 @@
+from typing import Dict, List
+from dotenv import load_dotenv
+from .call_resolver import symbols_from_records, resolve_calls
+from .neo4j_conn import ensure_schema, create_vector_indexes
+from .symbol_graph import symbol_calls, resolve_imports
+import csv
+import gzip
+import os
+import sys
+
+load_dotenv()
+
+IMPORT_DIR = os.getenv("NEO4J_IMPORT_DIR", "./neo4j/import")
+
+# file name -> header, in neo4j-admin import format. Integer ids are kept as
+# long properties; the :ID columns only identify rows within an ID space.
+NODE_FILES = {
+    "repositories": ["name:ID(Repository)", "last_commit", "version:long", ":LABEL"],
+    "files": [":ID(File)", "fid:long", "path", "repo", "content_hash", ":LABEL"],
+    "ast_nodes": [":ID(AstNode)", "id:long", "type", "text", "start_byte:int", "end_byte:int", "semantic_type",
+                  "name", "file", "repo", "callee", "scope:long", "embedding:float[]", ":LABEL"],
+    "variables": ["name:ID(Variable)", ":LABEL"],
+    "symbols": [":ID(Symbol)", "id:long", "kind", "name", "signature", "file", "repo", "start_line:int",
+                "end_line:int", ":LABEL"],
+}
+REL_FILES = {
+    "has_file": [":START_ID(Repository)", ":END_ID(File)", ":TYPE"],
+    "has_ast_root": [":START_ID(File)", ":END_ID(AstNode)", ":TYPE"],
+    "child": [":START_ID(AstNode)", ":END_ID(AstNode)", ":TYPE"],
+    "calls": [":START_ID(AstNode)", ":END_ID(AstNode)", ":TYPE"],
+    "def": [":START_ID(AstNode)", ":END_ID(Variable)", ":TYPE"],
+    "use": [":START_ID(AstNode)", ":END_ID(Variable)", ":TYPE"],
+    "symbol_ast": [":START_ID(Symbol)", ":END_ID(AstNode)", ":TYPE"],
+    "file_contains": [":START_ID(File)", ":END_ID(Symbol)", ":TYPE"],
+    "symbol_contains": [":START_ID(Symbol)", ":END_ID(Symbol)", ":TYPE"],
+    "file_defines": [":START_ID(File)", ":END_ID(Variable)", ":TYPE"],
+    "symbol_defines": [":START_ID(Symbol)", ":END_ID(Variable)", ":TYPE"],
+    "file_uses": [":START_ID(File)", ":END_ID(Variable)", ":TYPE"],
+    "symbol_uses": [":START_ID(Symbol)", ":END_ID(Variable)", ":TYPE"],
+    "file_calls": [":START_ID(File)", ":END_ID(Symbol)", "count:int", ":TYPE"],
+    "symbol_calls": [":START_ID(Symbol)", ":END_ID(Symbol)", "count:int", ":TYPE"],
+    "imports": [":START_ID(File)", ":END_ID(File)", ":TYPE"],
+}
+
+
+class BulkImportWriter:
+    """
+    Pipeline sink that streams collect_code_graph records into gzip CSV
+    files for `neo4j-admin database import full`, instead of writing to a
+    live database. Only definitions, call sites and imports are kept in
+    memory, so CALLS and IMPORTS can be resolved (see call_resolver and
+    symbol_graph) when the export is closed.
+
+    Not thread-safe: run the pipeline with a single write worker.
+    """
+
+    def __init__(self, repo_name: str, out_dir: str = None, commit: str = None, batch_files: int = 50):
+        self.repo_name = repo_name
+        self.out_dir = out_dir or os.path.join(IMPORT_DIR, repo_name)
+        self.batch_files = batch_files
+        self.pending: List[Dict] = []
+        self.symbols = ([], [], [])
+        self.files = []
+        self.variables = set()
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        self._handles = {}
+        self._writers = {}
+        for name, header in {**NODE_FILES, **REL_FILES}.items():
+            fh = gzip.open(os.path.join(self.out_dir, f"{name}.csv.gz"), "wt", newline="", encoding="utf-8")
+            self._handles[name] = fh
+            self._writers[name] = csv.writer(fh)
+            self._writers[name].writerow(header)
+
+        self._writers["repositories"].writerow([repo_name, commit or "", 1, "Repository"])
+
+    def flush(self):
+        batch, self.pending = self.pending, []
+        w = self._writers
+        for records in batch:
+            fid = records["fid"]
+            w["files"].writerow([fid, fid, records["file"], records["repo"], records["hash"] or "", "File"])
+            w["has_file"].writerow([self.repo_name, fid, "HAS_FILE"])
+            w["has_ast_root"].writerow([fid, records["root"], "HAS_AST_ROOT"])
+
+            for n in records["nodes"]:
+                emb = n.get("embedding")
+                w["ast_nodes"].writerow([
+                    n["id"], n["id"], n["type"], n["text"] or "", n["start_byte"], n["end_byte"],
+                    n["semantic_type"] or "", n["name"] or "",
+                    n["file"], n["repo"], n.get("callee") or "", "" if n.get("scope") is None else n["scope"],
+                    ";".join(repr(x) for x in emb) if emb else "", "AstNode",
+                ])
+            for e in records["child"]:
+                w["child"].writerow([e["parent"], e["child"], "CHILD"])
+            for kind, rel_type in (("defs", "DEF"), ("uses", "USE")):
+                for e in records[kind]:
+                    self._variable(e["var"])
+                    w[rel_type.lower()].writerow([e["node"], e["var"], rel_type])
+
+            # symbol layer (see symbol_graph)
+            for sym in records["symbols"]:
+                w["symbols"].writerow([sym["id"], sym["id"], sym["kind"], sym["name"], sym["signature"], sym["file"],
+                                       sym["repo"], sym["start_line"], sym["end_line"], f"Symbol;{sym['kind']}"])
+                w["symbol_ast"].writerow([sym["id"], sym["id"], "AST_NODE"])
+                if sym["parent"] is None:
+                    w["file_contains"].writerow([fid, sym["id"], "CONTAINS"])
+                else:
+                    w["symbol_contains"].writerow([sym["parent"], sym["id"], "CONTAINS"])
+            for kind, rel_type in (("sym_defines", "DEFINES"), ("sym_uses", "USES")):
+                for e in records[kind]:
+                    self._variable(e["var"])
+                    if e["scope"] is None:
+                        w[f"file_{rel_type.lower()}"].writerow([fid, e["var"], rel_type])
+                    else:
+                        w[f"symbol_{rel_type.lower()}"].writerow([e["scope"], e["var"], rel_type])
+            self.files.append({"fid": fid, "file": records["file"]})
+
+            defs, calls, imports = symbols_from_records([records])
+            self.symbols[0].extend(defs)
+            self.symbols[1].extend(calls)
+            self.symbols[2].extend(imports)
+
+    def _variable(self, name: str):
+        if name not in self.variables:
+            self.variables.add(name)
+            self._writers["variables"].writerow([name, "Variable"])
+
+    def close(self) -> str:
+        """Resolve and write CALLS and IMPORTS, close every file and return the neo4j-admin command to run."""
+        self.flush()
+        w = self._writers
+        defs, calls, imports = self.symbols
+        edges = resolve_calls(defs, calls, imports)
+        for e in edges:
+            w["calls"].writerow([e["caller"], e["callee"], "CALLS"])
+        from_symbols, from_files = symbol_calls(edges, calls)
+        for e in from_symbols:
+            w["symbol_calls"].writerow([e["src"], e["dst"], e["count"], "CALLS"])
+        for e in from_files:
+            w["file_calls"].writerow([e["src"], e["dst"], e["count"], "CALLS"])
+        for e in resolve_imports(self.files, imports):
+            w["imports"].writerow([e["src"], e["dst"], "IMPORTS"])
+        for fh in self._handles.values():
+            fh.close()
+
+        args = ["neo4j-admin database import full neo4j",
+                "--overwrite-destination", "--multiline-fields=true", "--array-delimiter=';'"]
+        args += [f"--nodes={os.path.join(self.out_dir, n)}.csv.gz" for n in NODE_FILES]
+        args += [f"--relationships={os.path.join(self.out_dir, r)}.csv.gz" for r in REL_FILES]
+        command = " \\\n    ".join(args)
+
+        with open(os.path.join(self.out_dir, "import.sh"), "w") as f:
+            f.write("#!/bin/sh\n# Stop Neo4j first; the offline importer replaces the whole database.\n")
+            f.write(command + "\n")
+        return command
+
+
+def finish_bulk_import():
+    """Run once Neo4j is back up on the imported store: constraints, lookup, vector and fulltext indexes."""
+    ensure_schema()
+    create_vector_indexes()
+
+
+USAGE = """usage:
+  python -m service.graph.bulk_import export <repo>   write import files for the repo cloned under LOCAL_REPO_PATH
+  python -m service.graph.bulk_import finish          build the indexes once Neo4j runs on the imported store"""
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "export":
+        # imported here: ingest_repo itself imports this module
+        from ..ingest_repo import initiate_graph
+        initiate_graph(sys.argv[2], mode="import")
+    elif sys.argv[1:] == ["finish"]:
+        finish_bulk_import()
+    else:
+        print(USAGE)
+        sys.exit(2)
@@ -0,0 +1,187 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+from .ast_util import file_id
+from .neo4j_conn import query, run, write_batches
+from .symbol_graph import link_symbol_layer
+import os
+import re
+import time
+
+load_dotenv()
+
+# A call whose name matches more definitions than this (after file and
+# import scoping) is considered too ambiguous to link at all.
+MAX_AMBIGUOUS_TARGETS = int(os.getenv("CALLS_MAX_AMBIGUOUS_TARGETS", "5"))
+
+DEF_SEMANTIC_TYPES = ("function", "class_or_type")
+
+_IDENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def _module_stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def symbols_from_records(batch: Iterable[Dict]):
+    """Definitions, call sites and import texts from collect_code_graph records (no database needed)."""
+    defs, calls, imports = [], [], []
+    for records in batch:
+        for n in records["nodes"]:
+            st = n["semantic_type"]
+            if st in DEF_SEMANTIC_TYPES and n["name"]:
+                defs.append({"id": n["id"], "name": n["name"], "file": n["file"]})
+            elif st == "call" and n.get("callee"):
+                calls.append({"id": n["id"], "callee": n["callee"], "file": n["file"],
+                              "scope": n.get("scope"), "fid": records["fid"]})
+            elif st == "import_statement" and n["text"]:
+                imports.append({"file": n["file"], "text": n["text"]})
+    return defs, calls, imports
+
+
+def defined_names(repo_name: str, files: List[str]) -> set:
+    """Names of the functions and classes the repo's graph currently defines in `files` (repo-relative)."""
+    rows = query("""
+        MATCH (n:AstNode {repo: $repo})
+        WHERE n.file IN $files AND n.semantic_type IN $types AND n.name IS NOT NULL
+        RETURN DISTINCT n.name AS name
+    """, {"repo": repo_name, "files": list(files), "types": list(DEF_SEMANTIC_TYPES)})
+    return {r["name"] for r in rows}
+
+
+def load_symbols(repo_name: str):
+    """Same as symbols_from_records, read back from the repo's ingested AstNodes."""
+    defs = query("""
+        MATCH (n:AstNode {repo: $repo})
+        WHERE n.semantic_type IN $types AND n.name IS NOT NULL
+        RETURN n.id AS id, n.name AS name, n.file AS file
+    """, {"repo": repo_name, "types": list(DEF_SEMANTIC_TYPES)})
+    calls = query("""
+        MATCH (n:AstNode {repo: $repo, semantic_type: 'call'})
+        WHERE n.callee IS NOT NULL
+        RETURN n.id AS id, n.callee AS callee, n.file AS file, n.scope AS scope
+    """, {"repo": repo_name})
+    for c in calls:
+        c["fid"] = file_id(repo_name, c["file"])
+    imports = query("""
+        MATCH (n:AstNode {repo: $repo, semantic_type: 'import_statement'})
+        RETURN n.file AS file, n.text AS text
+    """, {"repo": repo_name})
+    return defs, calls, imports
+
+
+def load_scoped_symbols(repo_name: str, files: List[str], names: set):
+    """
+    Like load_symbols, limited to what an incremental run can change: the
+    call sites in `files` plus those elsewhere calling one of `names`, the
+    definitions those sites could link to and the imports of their files.
+    """
+    calls = query("""
+        MATCH (n:AstNode {repo: $repo, semantic_type: 'call'})
+        WHERE n.callee IS NOT NULL AND (n.file IN $files OR n.callee IN $names)
+        RETURN n.id AS id, n.callee AS callee, n.file AS file, n.scope AS scope
+    """, {"repo": repo_name, "files": list(files), "names": sorted(names)})
+    for c in calls:
+        c["fid"] = file_id(repo_name, c["file"])
+    defs = query("""
+        MATCH (n:AstNode {repo: $repo})
+        WHERE n.semantic_type IN $types AND n.name IN $callees
+        RETURN n.id AS id, n.name AS name, n.file AS file
+    """, {"repo": repo_name, "types": list(DEF_SEMANTIC_TYPES), "callees": sorted({c["callee"] for c in calls})})
+    imports = query("""
+        MATCH (n:AstNode {repo: $repo, semantic_type: 'import_statement'})
+        WHERE n.file IN $files
+        RETURN n.file AS file, n.text AS text
+    """, {"repo": repo_name, "files": sorted({c["file"] for c in calls})})
+    return defs, calls, imports
+
+
+def resolve_calls(defs: List[Dict], calls: List[Dict], imports: List[Dict]) -> List[Dict]:
+    """
+    Link call sites to definitions with an in-memory symbol table.
+
+    For a call to `name` made in file F the candidates are, in order:
+    1. definitions of `name` in F itself
+    2. definitions of `name` in files whose module name F imports
+       (or F imports `name` explicitly and exactly one file defines it)
+    3. the definitions of `name` anywhere in the repo
+    The first non-empty tier wins; it is linked if it has at most
+    MAX_AMBIGUOUS_TARGETS entries. The output is sorted, so the same
+    graph always yields the same edges regardless of ingestion order.
+    """
+    by_name = defaultdict(list)
+    for d in defs:
+        by_name[d["name"]].append(d)
+
+    imported = defaultdict(set)
+    for imp in imports:
+        imported[imp["file"]].update(_IDENT.findall(imp["text"] or ""))
+
+    edges = set()
+    for call in calls:
+        candidates = by_name.get(call["callee"])
+        if not candidates:
+            continue
+
+        tier = [d for d in candidates if d["file"] == call["file"]]
+        if not tier:
+            tokens = imported.get(call["file"], set())
+            tier = [d for d in candidates if _module_stem(d["file"]) in tokens]
+            if not tier and call["callee"] in tokens and len({d["file"] for d in candidates}) == 1:
+                tier = candidates
+        if not tier:
+            tier = candidates
+
+        if len(tier) > MAX_AMBIGUOUS_TARGETS:
+            continue
+        for d in tier:
+            if d["id"] != call["id"]:
+                edges.add((call["id"], d["id"]))
+
+    return [{"caller": c, "callee": d} for c, d in sorted(edges)]
+
+
+def resolve_repo_calls(repo_name: str, files: Optional[List[str]] = None, names: Iterable[str] = ()) -> int:
+    """
+    Rebuild the CALLS edges of a repo after ingestion, then the repo-wide
+    edges of the symbol layer (aggregated CALLS and file IMPORTS).
+
+    Runs once per ingestion instead of once per file, so results no longer
+    depend on file order and the per-file write path has no name scans.
+    Without `files` every edge is rebuilt. With the repo-relative paths an
+    incremental run changed or removed, only call sites in those files and
+    call sites elsewhere to a name defined there are re-resolved; `names`
+    are the ones those files defined before the run (the graph now only
+    holds the new ones). Returns the number of AST CALLS edges written.
+    """
+    started = time.time()
+    if files is None:
+        defs, calls, imports = load_symbols(repo_name)
+    else:
+        names = set(names) | defined_names(repo_name, files)
+        defs, calls, imports = load_scoped_symbols(repo_name, files, names)
+    edges = resolve_calls(defs, calls, imports)
+
+    if files is None:
+        run("""
+            MATCH (:AstNode {repo: $repo})-[c:CALLS]->()
+            CALL { WITH c DELETE c } IN TRANSACTIONS OF 10000 ROWS
+        """, {"repo": repo_name})
+    else:
+        write_batches("""
+            UNWIND $rows AS id
+            MATCH (:AstNode {id: id})-[c:CALLS]->()
+            DELETE c
+        """, [c["id"] for c in calls])
+    write_batches("""
+        UNWIND $rows AS row
+        MATCH (caller:AstNode {id: row.caller})
+        MATCH (callee:AstNode {id: row.callee})
+        MERGE (caller)-[:CALLS]->(callee)
+    """, edges)
+
+    print(f"✔ Resolved {len(edges)} CALLS edges from {len(calls)} call sites "
+          f"and {len(defs)} definitions in {repo_name} ({time.time() - started:.1f}s)")
+
+    link_symbol_layer(repo_name, edges, calls, imports, files=files, names=names)
+    return len(edges)
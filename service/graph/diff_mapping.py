@@ -0,0 +1,141 @@
+from bisect import bisect_right
+from typing import Dict, List
+from dotenv import load_dotenv
+from .call_resolver import DEF_SEMANTIC_TYPES
+from .neo4j_conn import query
+from ..utils.repo_utils import SOURCE_EXT, file_at
+from . import source_store
+import os
+
+load_dotenv()
+
+# -----------------------------
+# CYPHER
+# -----------------------------
+FILES_QUERY = """
+MATCH (f:File {repo: $repo})
+WHERE f.path IN $paths
+RETURN f.path AS path, f.content_hash AS hash
+"""
+
+# Nodes of one file overlapping any of the byte ranges. Served by the
+# (repo, file, start_byte) interval index: equality on repo / file, then a
+# range seek on start_byte, with end_byte checked on the candidates.
+OVERLAP_QUERY = """
+UNWIND $ranges AS r
+MATCH (n:AstNode {repo: $repo, file: $file})
+WHERE n.start_byte <= r.end AND n.end_byte >= r.start
+RETURN r.i AS i, n.id AS id, n.start_byte AS start, n.end_byte AS end,
+       n.semantic_type AS semantic_type, n.name AS name
+"""
+
+
+def line_starts(source: bytes) -> List[int]:
+    """Byte offset at which each line starts (index 0 is line 1)."""
+    starts = [0]
+    pos = source.find(b"\n")
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = source.find(b"\n", pos + 1)
+    return starts
+
+
+def byte_ranges(source: bytes, hunks: List[tuple]) -> List[Dict]:
+    """
+    Diff hunks ((first line, count), base side) as byte ranges of `source`.
+    A pure insertion after line a becomes the empty range at the start of
+    line a + 1, so it only falls inside nodes spanning that point.
+    """
+    starts = line_starts(source)
+    ranges = []
+    for first, count in hunks:
+        if count == 0:
+            pos = starts[min(first, len(starts) - 1)] if first > 0 else 0
+            ranges.append({"start": pos, "end": pos})
+        else:
+            start = starts[min(first - 1, len(starts) - 1)]
+            end = starts[first - 1 + count] - 1 if first - 1 + count < len(starts) else len(source)
+            ranges.append({"start": start, "end": end})
+    return ranges
+
+
+def _seeds_for(rng: Dict, nodes: List[Dict]) -> List[Dict]:
+    """
+    The nodes a changed range stands for: every definition it overlaps,
+    except those that only overlap it through a nested definition (a change
+    inside a method is the method's, not its class's) unless the range
+    covers them whole; module-level changes fall back to the smallest node
+    covering the range.
+    """
+    defs = [n for n in nodes if n["semantic_type"] in DEF_SEMANTIC_TYPES and n["name"]]
+    picked = []
+    for d in defs:
+        whole = rng["start"] <= d["start"] and d["end"] <= rng["end"]
+        nested = any(o is not d and d["start"] <= o["start"] and o["end"] <= d["end"] for o in defs)
+        if whole or not nested:
+            picked.append(d)
+    if picked:
+        return picked
+    covering = [n for n in nodes if n["start"] <= rng["start"] and rng["end"] <= n["end"]]
+    return [min(covering, key=lambda n: (n["end"] - n["start"], n["id"]))] if covering else []
+
+
+def map_diff(repo_name: str, repo_path: str, merge_base: str, files: List[Dict]) -> Dict:
+    """
+    Changed base-side line ranges (repo_utils.diff_hunks) -> AST nodes of
+    the ingested graph, through the byte ranges nodes carry.
+
+    Returns {"seeds": [(node id, 1.0)], "changed": [{file, name, kind,
+    lines}], "added": [paths], "unmapped": [paths], "stale": [paths]}.
+    Added files have nothing in the graph yet; unmapped ones are source
+    files missing from it; stale ones were ingested at a different revision
+    than the merge base, so their ranges are mapped approximately.
+    """
+    source_files = [f for f in files if os.path.splitext(f["path"])[1].lower() in SOURCE_EXT]
+    known = {r["path"]: r["hash"] for r in query(FILES_QUERY, {
+        "repo": repo_name, "paths": [f["path"] for f in source_files]})}
+
+    result = {"seeds": [], "changed": [], "added": [], "unmapped": [], "stale": []}
+    seen = set()
+    for f in source_files:
+        path = f["path"]
+        if f["status"] == "added":
+            result["added"].append(path)
+            continue
+        if path not in known:
+            result["unmapped"].append(path)
+            continue
+        source = file_at(repo_path, merge_base, path)
+        if source is None:
+            result["unmapped"].append(path)
+            continue
+        if known[path] and known[path] != source_store.content_hash(source):
+            result["stale"].append(path)
+
+        if f["status"] == "deleted":
+            ranges = [{"start": 0, "end": len(source)}]
+        else:
+            ranges = byte_ranges(source, f["hunks"])
+        for i, r in enumerate(ranges):
+            r["i"] = i
+        by_range = {}
+        for n in query(OVERLAP_QUERY, {"repo": repo_name, "file": path, "ranges": ranges}):
+            by_range.setdefault(n["i"], []).append(n)
+
+        starts = line_starts(source)
+        for i, r in enumerate(ranges):
+            for n in _seeds_for(r, by_range.get(i, [])):
+                if n["id"] in seen:
+                    continue
+                seen.add(n["id"])
+                result["seeds"].append((n["id"], 1.0))
+                result["changed"].append({
+                    "file": path,
+                    "name": n["name"],
+                    "kind": n["semantic_type"],
+                    "lines": (bisect_right(starts, n["start"]), bisect_right(starts, max(n["end"] - 1, n["start"]))),
+                })
+
+    print(f"Mapped {len(source_files)} changed source files of {repo_name} to {len(result['seeds'])} nodes "
+          f"({len(result['added'])} added, {len(result['unmapped'])} unmapped, {len(result['stale'])} stale)")
+    return result
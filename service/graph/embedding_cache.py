@@ -0,0 +1,136 @@
+from array import array
+from typing import Dict, Iterable, List
+from dotenv import load_dotenv
+from ..metrics import register_collector
+from .. import clients
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+load_dotenv()
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "./embedding_cache.db")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "2000000"))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent text -> vector cache in a local SQLite file.
+
+    Entries are keyed by (model, dimension, sha256 of the input text) so a
+    model or dimension change never serves stale vectors. Vectors are stored
+    as packed float32. Every hit refreshes `last_used`; once the cache grows
+    past `max_entries` the least recently used tenth is evicted.
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, dim, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, dim: int, texts: Iterable[str]) -> Dict[str, List[float]]:
+        """Cached vectors for whichever of `texts` are present; updates hit/miss counters."""
+        by_hash = {text_hash(t): t for t in texts}
+        found = {}
+        hashes = list(by_hash)
+        with self._lock:
+            # stay well below SQLite's bound-parameter limit
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND dim = ? "
+                    f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                    [model, dim, *chunk],
+                ).fetchall()
+                for h, blob in rows:
+                    found[by_hash[h]] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND dim = ? AND text_hash = ?",
+                    [(now, model, dim, text_hash(t)) for t in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(by_hash) - len(found)
+        return found
+
+    def put_many(self, model: str, dim: int, vectors: Dict[str, List[float]]):
+        if not vectors:
+            return
+        now = time.time()
+        rows = [(model, dim, text_hash(t), array("f", v).tobytes(), now) for t, v in vectors.items()]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, dim, text_hash, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._size += self._conn.total_changes - before
+            if self._size > self.max_entries:
+                self._evict(self._size - int(self.max_entries * 0.9))
+            self._conn.commit()
+
+    def _evict(self, count: int):
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (count,),
+        )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+clients.register("embedding_cache", EmbeddingCache, close=lambda cache: cache.close())
+
+
+def get_cache() -> EmbeddingCache:
+    """The process-wide embedding cache, opened on first use."""
+    return clients.get("embedding_cache")
+
+
+def _lookups():
+    cache = clients.peek("embedding_cache")
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    return {(("result", "hit"),): hits, (("result", "miss"),): misses}
+
+
+register_collector(
+    "impact_embedding_cache_lookups_total", "counter", "Embedding cache lookups since start, by result", _lookups,
+)
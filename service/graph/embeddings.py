@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List
+from neo4j_graphrag.embeddings.base import Embedder
+from .embedding_cache import get_cache
+from .. import clients
+from dotenv import load_dotenv
+import ollama
+import os
+
+load_dotenv()
+
+# -----------------------------
+# EMBEDDING STAGE CONFIG
+# -----------------------------
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+EMBED_DIM = 768
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+# ollama.Client picks up OLLAMA_HOST from the environment; built on first use
+clients.register("embedder", ollama.Client)
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    response = clients.get("embedder").embed(model=EMBED_MODEL, input=texts)
+    if len(response.embeddings) != len(texts):
+        raise Exception(f"Embedder returned {len(response.embeddings)} vectors for {len(texts)} inputs")
+    return response.embeddings
+
+
+def embed_texts(texts: Iterable[str], batch_size: int = None, concurrency: int = None) -> Dict[str, List[float]]:
+    """
+    Embed many texts with as few round trips as possible.
+
+    Empty inputs are dropped, identical inputs are looked up once, and texts
+    already in the persistent embedding cache never reach the model. The
+    remaining texts go to the embedder in batches of `batch_size`, at most
+    `concurrency` requests in flight. Returns a text -> vector mapping.
+    """
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    concurrency = concurrency or EMBED_CONCURRENCY
+
+    unique = list(dict.fromkeys(t for t in texts if t))
+    if not unique:
+        return {}
+
+    vectors = get_cache().get_many(EMBED_MODEL, EMBED_DIM, unique)
+    missing = [t for t in unique if t not in vectors]
+    if not missing:
+        return vectors
+
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    computed = {}
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+        for batch, embedded in zip(batches, pool.map(_embed_batch, batches)):
+            computed.update(zip(batch, embedded))
+    get_cache().put_many(EMBED_MODEL, EMBED_DIM, computed)
+
+    vectors.update(computed)
+    return vectors
+
+
+def attach_embeddings(nodes: List[Dict]) -> int:
+    """
+    Resolve the `emb_text` of each node record (one file's or many files')
+    into an `embedding`. Nodes without embedding text get None, which leaves
+    the property unset in Neo4j. Returns the number of embedded nodes.
+    """
+    vectors = embed_texts(n.get("emb_text") for n in nodes)
+    embedded = 0
+    for n in nodes:
+        n["embedding"] = vectors.get(n.pop("emb_text", None))
+        if n["embedding"] is not None:
+            embedded += 1
+    return embedded
+
+
+class CachedEmbeddings(Embedder):
+    """
+    neo4j-graphrag embedder for query time, backed by the same model and
+    persistent cache as ingestion.
+    """
+
+    def embed_query(self, text: str, **kwargs: Any) -> List[float]:
+        return embed_texts([text])[text]
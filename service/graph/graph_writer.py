@@ -0,0 +1,168 @@
+from typing import Dict, List
+from dotenv import load_dotenv
+from .neo4j_conn import get_driver, ensure_schema, EMBEDDING_STORAGE
+from .symbol_graph import UPSERT_SYMBOLS, SYMBOL_CONTAINS, SYMBOL_DEFINES, SYMBOL_USES
+from ..metrics import observe, inc
+import os
+import time
+
+load_dotenv()
+
+# Files grouped into one write transaction, and max rows per UNWIND inside it
+WRITE_BATCH_FILES = int(os.getenv("NEO4J_WRITE_BATCH_FILES", "50"))
+WRITE_BATCH_ROWS = int(os.getenv("NEO4J_WRITE_BATCH_ROWS", "10000"))
+
+# -----------------------------
+# CYPHER (all UNWIND over many files' rows)
+# -----------------------------
+DELETE_STALE = """
+    UNWIND $files AS f
+    MATCH (n:AstNode {repo: f.repo, file: f.file})
+    DETACH DELETE n
+"""
+
+DELETE_STALE_SYMBOLS = """
+    UNWIND $files AS f
+    OPTIONAL MATCH (s:Symbol {repo: f.repo, file: f.file})
+    DETACH DELETE s
+    WITH DISTINCT f
+    MATCH (:File {fid: f.fid})-[r:DEFINES|USES]->()
+    DELETE r
+"""
+
+UPSERT_FILES = """
+    UNWIND $files AS f
+    MERGE (r:Repository {name: f.repo})
+    MERGE (file:File {fid: f.fid})
+    SET file.path = f.file,
+        file.repo = f.repo,
+        file.updatedAt = timestamp(),
+        file.content_hash = f.hash
+    MERGE (r)-[:HAS_FILE]->(file)
+"""
+
+UPSERT_NODES = """
+    UNWIND $rows AS n
+    MERGE (a:AstNode {id: n.id})
+    SET a.type = n.type,
+        a.text = n.text,
+        a.start_byte = n.start_byte,
+        a.end_byte = n.end_byte,
+        a.semantic_type = n.semantic_type,
+        a.name = n.name,
+        a.file = n.file,
+        a.repo = n.repo,
+        a.callee = n.callee,
+        a.scope = n.scope,
+        a.embedding = n.embedding
+"""
+if EMBEDDING_STORAGE == "float32":
+    # the driver sends floats as 64-bit; store the vector as a 32-bit float array instead
+    UPSERT_NODES = UPSERT_NODES.replace("a.embedding = n.embedding", """a.embedding = null
+    WITH a, n
+    WHERE n.embedding IS NOT NULL
+    CALL db.create.setNodeVectorProperty(a, 'embedding', n.embedding)""")
+
+LINK_ROOTS = """
+    UNWIND $files AS f
+    MATCH (file:File {fid: f.fid})
+    MATCH (r:AstNode {id: f.root})
+    MERGE (file)-[:HAS_AST_ROOT]->(r)
+"""
+
+CHILD_EDGES = """
+    UNWIND $rows AS r
+    MATCH (p:AstNode {id: r.parent})
+    MATCH (c:AstNode {id: r.child})
+    MERGE (p)-[:CHILD]->(c)
+"""
+
+DEF_EDGES = """
+    UNWIND $rows AS row
+    MATCH (n:AstNode {id: row.node})
+    MERGE (v:Variable {name: row.var})
+    MERGE (n)-[:DEF]->(v)
+"""
+
+USE_EDGES = """
+    UNWIND $rows AS row
+    MATCH (n:AstNode {id: row.node})
+    MERGE (v:Variable {name: row.var})
+    MERGE (n)-[:USE]->(v)
+"""
+
+
+class GraphWriter:
+    """
+    Buffers collect_code_graph records and writes many files per managed
+    write transaction.
+
+    A flush replaces the AST subgraph of every buffered file in one
+    transaction: stale nodes are deleted, then files, nodes and edges are
+    upserted with UNWIND in chunks of `batch_rows`. execute_write retries the
+    whole transaction on transient errors (deadlocks, leader switches), so a
+    partially written batch is never left behind.
+
+    The same transaction replaces the files' part of the symbol layer
+    (Function / Class nodes, CONTAINS, DEFINES / USES). CALLS and IMPORTS
+    edges are not written here; call_resolver links them once the whole
+    repo has been ingested.
+    """
+
+    def __init__(self, batch_files: int = None, batch_rows: int = None):
+        self.batch_files = batch_files or WRITE_BATCH_FILES
+        self.batch_rows = batch_rows or WRITE_BATCH_ROWS
+        self.pending: List[Dict] = []
+        self.rows_written = 0
+        self.seconds = 0.0
+        ensure_schema()
+
+    def add(self, records: Dict):
+        self.pending.append(records)
+        if len(self.pending) >= self.batch_files:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+
+        files = [{"repo": r["repo"], "file": r["file"], "fid": r["fid"], "hash": r["hash"], "root": r["root"]}
+                 for r in batch]
+        steps = [
+            (DELETE_STALE, None),
+            (UPSERT_FILES, None),
+            (UPSERT_NODES, [n for r in batch for n in r["nodes"]]),
+            (LINK_ROOTS, None),
+            (CHILD_EDGES, [e for r in batch for e in r["child"]]),
+            (DEF_EDGES, [e for r in batch for e in r["defs"]]),
+            (USE_EDGES, [e for r in batch for e in r["uses"]]),
+            # symbol layer of the same files
+            (DELETE_STALE_SYMBOLS, None),
+            (UPSERT_SYMBOLS, [s for r in batch for s in r["symbols"]]),
+            (SYMBOL_CONTAINS, [s for r in batch for s in r["symbols"]]),
+            (SYMBOL_DEFINES, [e for r in batch for e in r["sym_defines"]]),
+            (SYMBOL_USES, [e for r in batch for e in r["sym_uses"]]),
+        ]
+        rows = sum(len(s[1]) for s in steps if s[1]) + len(files)
+
+        def work(tx):
+            for cypher, step_rows in steps:
+                if step_rows is None:
+                    tx.run(cypher, {"files": files}).consume()
+                    continue
+                for i in range(0, len(step_rows), self.batch_rows):
+                    tx.run(cypher, {"rows": step_rows[i:i + self.batch_rows]}).consume()
+
+        started = time.time()
+        with get_driver().session() as session:
+            session.execute_write(work)
+        elapsed = time.time() - started
+        observe("impact_neo4j_seconds", elapsed, op="writer_flush")
+        inc("impact_neo4j_rows_written_total", rows)
+
+        self.rows_written += rows
+        self.seconds += elapsed
+        print(f"✔ Wrote {len(batch)} files / {rows} rows in {elapsed:.2f}s "
+              f"({rows / elapsed if elapsed else 0:.0f} rows/s, "
+              f"{self.rows_written / self.seconds if self.seconds else 0:.0f} rows/s overall)")
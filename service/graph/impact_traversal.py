@@ -0,0 +1,221 @@
+from typing import Dict, Iterable, List, Tuple
+from dotenv import load_dotenv
+from .call_resolver import DEF_SEMANTIC_TYPES
+from .neo4j_conn import query
+import os
+import time
+
+load_dotenv()
+
+# -----------------------------
+# TRAVERSAL CONFIG
+# -----------------------------
+IMPACT_MAX_DEPTH = int(os.getenv("IMPACT_MAX_DEPTH", "3"))
+# neighbours followed per unit, per edge kind, per hop
+IMPACT_MAX_FANOUT = int(os.getenv("IMPACT_MAX_FANOUT", "25"))
+# stop adding units once this many have been reached
+IMPACT_MAX_UNITS = int(os.getenv("IMPACT_MAX_UNITS", "500"))
+# score multiplier per hop, on top of the edge weight
+IMPACT_HOP_DECAY = float(os.getenv("IMPACT_HOP_DECAY", "0.7"))
+
+# How strongly a change propagates along each reverse dependency
+EDGE_WEIGHTS = {
+    "calls": 1.0,       # caller -[:CALLS]-> changed definition (symbol layer)
+    "references": 0.6,  # identifier use of the changed definition's name (callbacks, registries, re-exports)
+    "data_flow": 0.5,   # reads a variable the changed definition assigns (same file)
+}
+
+# nearest enclosing named definitions of a node, innermost first
+ENCLOSING_QUERY = """
+UNWIND $ids AS id
+MATCH (n:AstNode {id: id})
+OPTIONAL MATCH p = (d:AstNode)-[:CHILD*0..64]->(n)
+WHERE d.semantic_type IN $types AND d.name IS NOT NULL
+WITH n, d, length(p) AS dist
+ORDER BY dist
+RETURN n.id AS id, n.file AS file,
+       collect(CASE WHEN d IS NULL THEN NULL
+               ELSE {id: d.id, name: d.name, kind: d.semantic_type} END) AS scopes
+"""
+
+# over the symbol layer's aggregated CALLS: a calling Symbol shares its
+# definition's AST id; a File (module-level calls) stands for its AST root
+CALLERS_QUERY = """
+UNWIND $ids AS id
+MATCH (d:Symbol {id: id})<-[c:CALLS]-(caller)
+OPTIONAL MATCH (caller:File)-[:HAS_AST_ROOT]->(root:AstNode)
+WITH d, coalesce(root.id, caller.id) AS hit, c.count AS calls
+ORDER BY calls DESC, hit
+RETURN d.id AS id, collect(hit)[..$fanout] AS hits
+"""
+
+REFERENCES_QUERY = """
+UNWIND $units AS u
+MATCH (:Variable {name: u.name})<-[:USE]-(r:AstNode {repo: $repo})
+WITH u, r ORDER BY r.file, r.id
+RETURN u.id AS id, collect(r.id)[..$fanout] AS hits
+"""
+
+DATA_FLOW_QUERY = """
+UNWIND $ids AS id
+MATCH (d:AstNode {id: id})-[:CHILD*]->(:AstNode)-[:DEF]->(v:Variable)<-[:USE]-(r:AstNode)
+WHERE r.repo = d.repo AND r.file = d.file
+WITH d, r ORDER BY r.id
+RETURN d.id AS id, collect(DISTINCT r.id)[..$fanout] AS hits
+"""
+
+
+def _enclosing(ids: Iterable[int]) -> Dict[int, Dict]:
+    """
+    Map AST node ids to their impact unit: the innermost named function or
+    class around them (the node itself if it is one), or module scope.
+    """
+    units = {}
+    for r in query(ENCLOSING_QUERY, {"ids": list(ids), "types": list(DEF_SEMANTIC_TYPES)}):
+        scopes = r["scopes"]
+        if scopes:
+            unit = dict(scopes[0], file=r["file"])
+            # the class a method belongs to, for the class-level roll-up
+            unit["class"] = next((s for s in scopes[1:] if s["kind"] == "class_or_type"), None)
+        else:
+            unit = {"id": None, "name": None, "kind": "module", "file": r["file"], "class": None}
+        units[r["id"]] = unit
+    return units
+
+
+def _unit_key(unit: Dict):
+    return unit["id"] if unit["id"] is not None else ("module", unit["file"])
+
+
+def _neighbours(frontier: List[Dict], repo: str, fanout: int) -> List[Tuple[Dict, str, int]]:
+    """(source unit, edge kind, reached AST node id) for every reverse dependency of the frontier."""
+    ids = [u["id"] for u in frontier]
+    by_id = {u["id"]: u for u in frontier}
+    found = []
+    for kind, cypher, params in (
+        ("calls", CALLERS_QUERY, {"ids": ids}),
+        ("references", REFERENCES_QUERY, {"units": [{"id": u["id"], "name": u["name"]} for u in frontier],
+                                          "repo": repo}),
+        ("data_flow", DATA_FLOW_QUERY, {"ids": ids}),
+    ):
+        for r in query(cypher, {**params, "fanout": fanout}):
+            found.extend((by_id[r["id"]], kind, hit) for hit in r["hits"])
+    return found
+
+
+def traverse_impact(repo: str, seeds: List[Tuple[int, float]], max_depth: int = None,
+                    fanout: int = None, max_units: int = None) -> Dict:
+    """
+    Deterministic reverse-dependency expansion from seed AST nodes.
+
+    Seeds ((node id, score) pairs, e.g. retrieval hits) are lifted to their
+    enclosing function / class. Each hop then follows, for every unit in the
+    frontier, who depends on it: callers over CALLS, identifier uses of its
+    name over USE, and same-file readers of the variables it assigns over
+    DEF/USE. Reached nodes are lifted to their own enclosing unit and scored
+    score(parent) * EDGE_WEIGHTS[kind] * IMPACT_HOP_DECAY; a unit keeps its
+    best score and the depth it was first reached at. Module-scope code is
+    recorded for its file but not expanded further.
+
+    Bounded by max_depth hops, `fanout` neighbours per unit and edge kind,
+    and max_units units overall. Neighbours are read in id order, so the
+    same graph and seeds always give the same result.
+    """
+    max_depth = IMPACT_MAX_DEPTH if max_depth is None else max_depth
+    fanout = fanout or IMPACT_MAX_FANOUT
+    max_units = max_units or IMPACT_MAX_UNITS
+    started = time.time()
+
+    seed_scores = {}
+    for nid, score in seeds:
+        seed_scores[nid] = max(score, seed_scores.get(nid, 0.0))
+    lifted = _enclosing(seed_scores)
+
+    impacted = {}
+    for nid in sorted(seed_scores):
+        unit = lifted.get(nid)
+        if unit is None:
+            continue
+        key = _unit_key(unit)
+        entry = impacted.setdefault(key, {**unit, "score": 0.0, "depth": 0, "via": "seed"})
+        entry["score"] = max(entry["score"], seed_scores[nid])
+
+    frontier = sorted((u for u in impacted.values() if u["id"] is not None), key=lambda u: u["id"])
+    depth = 0
+    while frontier and depth < max_depth and len(impacted) < max_units:
+        depth += 1
+        edges = _neighbours(frontier, repo, fanout)
+        reached = _enclosing({hit for _, _, hit in edges})
+
+        next_frontier = []
+        for source, kind, hit in edges:
+            unit = reached.get(hit)
+            if unit is None:
+                continue
+            key = _unit_key(unit)
+            if key == _unit_key(source):
+                continue
+            score = source["score"] * EDGE_WEIGHTS[kind] * IMPACT_HOP_DECAY
+            entry = impacted.get(key)
+            if entry is None:
+                if len(impacted) >= max_units:
+                    continue
+                entry = {**unit, "score": score, "depth": depth,
+                         "via": f"{kind} {source['name'] or source['file']}"}
+                impacted[key] = entry
+                if unit["id"] is not None:
+                    next_frontier.append(entry)
+            elif score > entry["score"]:
+                entry["score"] = score
+        frontier = sorted(next_frontier, key=lambda u: u["id"])
+
+    result = rollup(impacted.values())
+    result["stats"] = {"seeds": len(seed_scores), "units": len(impacted),
+                       "depth": max((u["depth"] for u in impacted.values()), default=0),
+                       "seconds": round(time.time() - started, 3)}
+    return result
+
+
+def rollup(units: Iterable[Dict]) -> Dict:
+    """Group impacted units by function, class and file, best score first."""
+    functions, classes, files = [], {}, {}
+
+    def bump(table, key, row):
+        entry = table.setdefault(key, row)
+        if row["score"] > entry["score"]:
+            entry.update(score=row["score"], depth=row["depth"], via=row["via"])
+        return entry
+
+    for u in units:
+        score = round(u["score"], 4)
+        row = {"score": score, "depth": u["depth"], "via": u["via"]}
+        if u["kind"] == "function":
+            functions.append({"id": u["id"], "name": u["name"], "file": u["file"],
+                              "class": u["class"]["name"] if u["class"] else None, **row})
+        if u["kind"] == "class_or_type":
+            bump(classes, u["id"], {"id": u["id"], "name": u["name"], "file": u["file"], **row})
+        elif u["class"]:
+            c = u["class"]
+            bump(classes, c["id"], {"id": c["id"], "name": c["name"], "file": u["file"], **row})
+        f = bump(files, u["file"], {"file": u["file"], "units": 0, **row})
+        f["units"] += 1
+
+    order = lambda r: (-r["score"], r["depth"], r.get("file") or "", r.get("name") or "")
+    return {
+        "functions": sorted(functions, key=order),
+        "classes": sorted(classes.values(), key=order),
+        "files": sorted(files.values(), key=order),
+    }
+
+
+def format_impact(result: Dict, limit: int = 50) -> str:
+    """Plain-text impact set for the LLM write-up."""
+    lines = ["Impacted files:"]
+    lines += [f"- {f['file']} (score {f['score']}, {f['units']} units, {f['via']})" for f in result["files"][:limit]]
+    lines.append("Impacted classes:")
+    lines += [f"- {c['name']} in {c['file']} (score {c['score']}, depth {c['depth']}, {c['via']})"
+              for c in result["classes"][:limit]]
+    lines.append("Impacted functions:")
+    lines += [f"- {(f['class'] + '.') if f['class'] else ''}{f['name']} in {f['file']} "
+              f"(score {f['score']}, depth {f['depth']}, {f['via']})" for f in result["functions"][:limit]]
+    return "\n".join(lines)
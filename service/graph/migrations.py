@@ -0,0 +1,104 @@
+from dotenv import load_dotenv
+from .ast_util import file_id, node_id
+from .neo4j_conn import query, run, write_batches
+import os
+
+load_dotenv()
+
+LOCAL_PATH = os.getenv("LOCAL_REPO_PATH")
+
+
+def migrate_node_ids():
+    """
+    Convert graphs ingested with path-string IDs ("<abs path>:<start>:<end>")
+    to the compact scheme: repo-relative File.path plus an integer File.fid,
+    and 64-bit AstNode.id / repo-relative AstNode.file.
+
+    Files that already carry an fid are skipped, so this is safe to re-run.
+    Edges are untouched because they hang off the nodes, not their IDs.
+    """
+    files = query("""
+        MATCH (f:File) WHERE f.fid IS NULL
+        RETURN elementId(f) AS eid, f.path AS path, f.repo AS repo
+    """)
+    for f in files:
+        rel = os.path.relpath(f["path"], os.path.join(LOCAL_PATH, f["repo"]))
+        fid = file_id(f["repo"], rel)
+
+        rows = []
+        for n in query("""
+            MATCH (n:AstNode {repo: $repo, file: $path})
+            RETURN n.id AS id, n.type AS type
+        """, {"repo": f["repo"], "path": f["path"]}):
+            if not isinstance(n["id"], str):
+                continue
+            _, start, end = n["id"].rsplit(":", 2)
+            rows.append({"old": n["id"], "new": node_id(fid, int(start), int(end), n["type"])})
+
+        write_batches("""
+            UNWIND $rows AS row
+            MATCH (n:AstNode {id: row.old})
+            SET n.id = row.new, n.file = $rel
+        """, rows, rel=rel)
+        run("""
+            MATCH (f:File) WHERE elementId(f) = $eid
+            SET f.fid = $fid, f.path = $rel
+        """, {"eid": f["eid"], "fid": fid, "rel": rel})
+
+    if files:
+        print(f"✔ Migrated {len(files)} files to compact node IDs")
+
+
+def drop_legacy_fulltext_indexes():
+    """
+    Retrieval searches symbolFulltextIndex; stop maintaining the AstNode
+    fulltext indexes it replaced (astFulltextIndex had no repo field,
+    astScopedFulltextIndex covered every node's inline text).
+    """
+    run("DROP INDEX astFulltextIndex IF EXISTS")
+    run("DROP INDEX astScopedFulltextIndex IF EXISTS")
+
+
+# Marker of a finished one-off data migration, so restarts do not repeat it
+MIGRATION_DONE = "MATCH (m:SchemaMigration {name: $name}) RETURN m.name AS name"
+
+
+def remove_zero_embeddings():
+    """
+    Graphs ingested before embedding was selective hold all-zero vectors on
+    the nodes it skipped. Their cosine is undefined, so drop them (once)
+    before they are converted and indexed.
+    """
+    if query(MIGRATION_DONE, {"name": "zero_embeddings_removed"}):
+        return
+    run("""
+        MATCH (n:AstNode) WHERE n.embedding IS NOT NULL AND all(x IN n.embedding WHERE x = 0)
+        CALL { WITH n REMOVE n.embedding }
+        IN TRANSACTIONS OF 10000 ROWS
+    """)
+    run("MERGE (m:SchemaMigration {name: 'zero_embeddings_removed'}) SET m.at = timestamp()")
+    print("✔ Removed all-zero embeddings")
+
+
+def convert_embeddings_to_float32():
+    """
+    Rewrite list-of-double embeddings as 32-bit float vectors
+    (EMBEDDING_STORAGE=float32), once: every rewrite also updates the
+    vector index, so it must not rerun on each start. Cypher cannot tell a
+    stored float32 array from a list of doubles, so completion is recorded
+    on a :SchemaMigration node instead (cleared by allow_float64_embeddings).
+    """
+    if query(MIGRATION_DONE, {"name": "embeddings_float32"}):
+        return
+    run("""
+        MATCH (n:AstNode) WHERE n.embedding IS NOT NULL
+        CALL { WITH n CALL db.create.setNodeVectorProperty(n, 'embedding', n.embedding) }
+        IN TRANSACTIONS OF 10000 ROWS
+    """)
+    run("MERGE (m:SchemaMigration {name: 'embeddings_float32'}) SET m.at = timestamp()")
+    print("✔ Converted embeddings to float32")
+
+
+def allow_float64_embeddings():
+    """EMBEDDING_STORAGE=float64 writes lists of doubles again; the next float32 start has to convert them."""
+    run("MATCH (m:SchemaMigration {name: 'embeddings_float32'}) DELETE m")
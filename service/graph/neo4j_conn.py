@@ -1,6 +1,9 @@
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
+from ..metrics import observe, inc
+from .. import clients
 import os
+import time
 
 load_dotenv()
 
@@ -8,9 +11,132 @@ NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USERNAME =  os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD =  os.getenv("NEO4J_PASSWORD")
 
-# Connect to the Neo4j database
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+# Managed write transactions retry transient errors for up to this many seconds
+NEO4J_MAX_RETRY_TIME = float(os.getenv("NEO4J_MAX_RETRY_TIME", "30"))
+NEO4J_POOL_SIZE = int(os.getenv("NEO4J_POOL_SIZE", "100"))
+
+
+def _connect():
+    # the driver connects lazily too; this only sets up its connection pool
+    return GraphDatabase.driver(
+        NEO4J_URI,
+        auth=(NEO4J_USERNAME, NEO4J_PASSWORD),
+        max_transaction_retry_time=NEO4J_MAX_RETRY_TIME,
+        max_connection_pool_size=NEO4J_POOL_SIZE,
+    )
+
+
+clients.register("neo4j", _connect, close=lambda driver: driver.close())
+
+
+def get_driver():
+    """The process-wide Neo4j driver, created on first use."""
+    return clients.get("neo4j")
 
 def run(query, params=None):
-    with driver.session() as session:
-        session.run(query, params or {})
\ No newline at end of file
+    started = time.time()
+    with get_driver().session() as session:
+        session.run(query, params or {}).consume()
+    observe("impact_neo4j_seconds", time.time() - started, op="run")
+
+def query(query, params=None):
+    started = time.time()
+    with get_driver().session() as session:
+        rows = [record.data() for record in session.run(query, params or {})]
+    observe("impact_neo4j_seconds", time.time() - started, op="query")
+    return rows
+
+
+def write_batches(query, rows, batch_size=10000, **params):
+    """Run an `UNWIND $rows` write over `rows` in chunks, one managed (retried) transaction per chunk."""
+    for i in range(0, len(rows), batch_size):
+        chunk = rows[i:i + batch_size]
+        started = time.time()
+        with get_driver().session() as session:
+            session.execute_write(lambda tx: tx.run(query, {"rows": chunk, **params}).consume())
+        observe("impact_neo4j_seconds", time.time() - started, op="write_batch")
+        inc("impact_neo4j_rows_written_total", len(chunk))
+
+# Constraints / lookup indexes behind every MERGE and MATCH of the ingestion writes
+SCHEMA = [
+    "CREATE CONSTRAINT ast_node_id IF NOT EXISTS FOR (n:AstNode) REQUIRE n.id IS UNIQUE",
+    "CREATE CONSTRAINT repository_name IF NOT EXISTS FOR (r:Repository) REQUIRE r.name IS UNIQUE",
+    # File paths are repo-relative, so only the (repo, path)-derived fid is unique
+    "DROP CONSTRAINT file_path IF EXISTS",
+    "CREATE CONSTRAINT file_fid IF NOT EXISTS FOR (f:File) REQUIRE f.fid IS UNIQUE",
+    "CREATE CONSTRAINT variable_name IF NOT EXISTS FOR (v:Variable) REQUIRE v.name IS UNIQUE",
+    "CREATE INDEX ast_node_repo_file IF NOT EXISTS FOR (n:AstNode) ON (n.repo, n.file)",
+    "CREATE INDEX ast_node_name IF NOT EXISTS FOR (n:AstNode) ON (n.name)",
+    "CREATE INDEX ast_node_repo_semantic_type IF NOT EXISTS FOR (n:AstNode) ON (n.repo, n.semantic_type)",
+    "CREATE INDEX file_repo_path IF NOT EXISTS FOR (f:File) ON (f.repo, f.path)",
+    # interval lookup of changed byte ranges (see diff_mapping)
+    "CREATE INDEX ast_node_interval IF NOT EXISTS FOR (n:AstNode) ON (n.repo, n.file, n.start_byte)",
+    # symbol layer (see symbol_graph)
+    "CREATE CONSTRAINT symbol_id IF NOT EXISTS FOR (s:Symbol) REQUIRE s.id IS UNIQUE",
+    "CREATE INDEX symbol_repo_file IF NOT EXISTS FOR (s:Symbol) ON (s.repo, s.file)",
+    "CREATE INDEX symbol_name IF NOT EXISTS FOR (s:Symbol) ON (s.name)",
+]
+
+_schema_ready = False
+
+def ensure_schema():
+    """Create the ingestion constraints and indexes once per process (idempotent)."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    for statement in SCHEMA:
+        run(statement)
+    run("CALL db.awaitIndexes(300)")
+    _schema_ready = True
+
+
+# -----------------------------
+# EMBEDDING STORAGE
+# -----------------------------
+# "float32": AstNode.embedding written with db.create.setNodeVectorProperty (4 bytes
+# per dimension, what the model produces); "float64": plain list property (8 bytes)
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "float32")
+# int8 scalar quantization inside the HNSW vector index; retrieval rescores the
+# ANN candidates against the full-precision property (see retrieval.py)
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "true").lower() in ("1", "true", "yes")
+
+
+VECTOR_INDEX_QUERY = """
+SHOW VECTOR INDEXES YIELD name, options
+WHERE name = 'astVectorIndex'
+RETURN options.indexConfig AS config
+"""
+
+
+def create_vector_indexes():
+    """
+    Create the vector and fulltext indexes if they are missing. Existing
+    indexes are left alone (never dropped), so restarts do not trigger a
+    repopulation; a vector index built with other settings is reported, and
+    has to be dropped by hand to be rebuilt.
+    """
+    existing = query(VECTOR_INDEX_QUERY)
+    if existing:
+        config = existing[0]["config"] or {}
+        quantized = config.get("vector.quantization.enabled")
+        if quantized is not None and bool(quantized) != VECTOR_QUANTIZATION:
+            print(f"astVectorIndex has vector.quantization.enabled={quantized}, VECTOR_QUANTIZATION is "
+                  f"{VECTOR_QUANTIZATION}; keeping the existing index (DROP INDEX astVectorIndex to rebuild it)")
+    run(f"""
+        CREATE VECTOR INDEX astVectorIndex IF NOT EXISTS
+        FOR (n:AstNode) ON (n.embedding)
+        OPTIONS {{
+        indexConfig: {{
+            `vector.dimensions`: 768,
+            `vector.similarity_function`: "cosine",
+            `vector.quantization.enabled`: {"true" if VECTOR_QUANTIZATION else "false"}
+        }}
+        }};
+    """)
+    # Fulltext index over the symbol layer only (names and definition lines);
+    # `repo` is indexed so a search can be scoped to one repo
+    run("""
+        CREATE FULLTEXT INDEX symbolFulltextIndex IF NOT EXISTS
+        FOR (s:Symbol) ON EACH [s.name, s.signature, s.repo]
+    """)
+    print("✔ Vector + fulltext indexes ready.")
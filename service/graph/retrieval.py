@@ -0,0 +1,142 @@
+from typing import Dict, List
+from dotenv import load_dotenv
+from .embeddings import CachedEmbeddings
+from .neo4j_conn import query
+from . import source_store
+import os
+import re
+import time
+
+load_dotenv()
+
+# -----------------------------
+# RETRIEVAL CONFIG
+# -----------------------------
+VECTOR_INDEX = "astVectorIndex"
+FULLTEXT_INDEX = "symbolFulltextIndex"
+# ANN candidates fetched per requested hit, before the repo / path / type filter
+RETRIEVAL_OVERSAMPLE = int(os.getenv("RETRIEVAL_OVERSAMPLE", "10"))
+# Re-rank ANN candidates by exact cosine on the stored full-precision vector,
+# undoing the index's int8 quantization error (VECTOR_QUANTIZATION)
+RETRIEVAL_RESCORE = os.getenv("RETRIEVAL_RESCORE", "true").lower() in ("1", "true", "yes")
+
+# every query returns the same node map: the properties the prompt context
+# needs, with the byte range and file revision its text is hydrated from
+_NODE = "node {.id, .semantic_type, .name, .file, .text, .start_byte, .end_byte, hash: f.content_hash} AS node"
+_FILE = "OPTIONAL MATCH (f:File {repo: node.repo, path: node.file})"
+
+_FILTERS = """
+  AND ($path_prefix IS NULL OR node.file STARTS WITH $path_prefix)
+  AND ($semantic_types IS NULL OR node.semantic_type IN $semantic_types)
+"""
+
+VECTOR_QUERY = """
+CALL db.index.vector.queryNodes($index, $candidates, $vector) YIELD node, score
+WHERE node.repo = $repo""" + _FILTERS + f"""
+WITH node, CASE WHEN $rescore THEN vector.similarity.cosine(node.embedding, $vector) ELSE score END AS score
+WHERE score IS NOT NULL
+ORDER BY score DESC, node.id
+LIMIT $top_k
+{_FILE}
+RETURN {_NODE}, score
+ORDER BY score DESC, node.id
+"""
+
+# Exact cosine over the repo's embedded nodes, for when the global ANN
+# candidates hold too few of them (a small repo among many large ones)
+EXACT_VECTOR_QUERY = """
+MATCH (node:AstNode {repo: $repo})
+WHERE node.embedding IS NOT NULL""" + _FILTERS + f"""
+WITH node, vector.similarity.cosine(node.embedding, $vector) AS score
+// null for the all-zero vectors older graphs hold (see migrations.remove_zero_embeddings)
+WHERE score IS NOT NULL
+ORDER BY score DESC, node.id
+LIMIT $top_k
+{_FILE}
+RETURN {_NODE}, score
+ORDER BY score DESC, node.id
+"""
+
+# The fulltext index covers Symbol names and signatures only; hits map back
+# to their definition's AST node
+FULLTEXT_QUERY = """
+CALL db.index.fulltext.queryNodes($index, $lucene, {limit: $candidates}) YIELD node AS sym, score
+WHERE sym.repo = $repo
+MATCH (node:AstNode {id: sym.id})
+WHERE true""" + _FILTERS + f"""
+WITH node, score
+ORDER BY score DESC, node.id
+LIMIT $top_k
+{_FILE}
+RETURN {_NODE}, score
+ORDER BY score DESC, node.id
+"""
+
+_embedder = None
+
+
+def _lucene_query(text: str, repo: str) -> str:
+    # Lucene syntax characters dropped and the rest lower-cased, so words like
+    # AND / NOT in the prompt are not read as operators
+    terms = re.sub(r'[+\-!(){}\[\]^"~*?:\\/&|]', " ", text or "").lower().strip()
+    if not terms:
+        return None
+    repo = repo.replace("\\", "\\\\").replace('"', '\\"')
+    return f'({terms}) AND repo:"{repo}"'
+
+
+def _normalized(rows: List[Dict]) -> Dict[int, Dict]:
+    top = max((r["score"] for r in rows), default=0) or 1
+    return {r["node"]["id"]: {"node": r["node"], "score": r["score"] / top} for r in rows}
+
+
+def search(query_text: str, repo: str, top_k: int = 20, path_prefix: str = None,
+           semantic_types: List[str] = None, oversample: int = None, rescore: bool = None) -> List[Dict]:
+    """
+    Hybrid (vector + fulltext) search restricted to one repo, and optionally
+    to files under `path_prefix` and to some semantic types.
+
+    The vector side asks the global ANN index for top_k * oversample
+    candidates, keeps the repo's and, with rescore (RETRIEVAL_RESCORE),
+    ranks them by exact cosine on the stored full-precision vectors instead
+    of the quantized index score. When that leaves fewer than top_k hits it
+    falls back to an exact scan of the repo's embedded nodes, so small
+    repos are not crowded out by large ones. The fulltext side ANDs the
+    repo into the Lucene query and matches symbol names and signatures
+    (definition lines). As in neo4j-graphrag's naive hybrid ranker,
+    each side's scores are normalized by its best hit and a node keeps the
+    higher of the two. Node text is read from the source store for the
+    returned hits only. Returns [{"node": {...}, "score": float}], best first.
+    """
+    global _embedder
+    if _embedder is None:
+        _embedder = CachedEmbeddings()
+    started = time.time()
+
+    params = {
+        "repo": repo,
+        "top_k": top_k,
+        "candidates": top_k * (oversample or RETRIEVAL_OVERSAMPLE),
+        "path_prefix": path_prefix,
+        "semantic_types": semantic_types or None,
+    }
+    vector = _embedder.embed_query(query_text)
+
+    rescore = RETRIEVAL_RESCORE if rescore is None else rescore
+    vector_rows = query(VECTOR_QUERY, {**params, "index": VECTOR_INDEX, "vector": vector, "rescore": rescore})
+    exact = len(vector_rows) < top_k
+    if exact:
+        vector_rows = query(EXACT_VECTOR_QUERY, {**params, "vector": vector})
+    lucene = _lucene_query(query_text, repo)
+    fulltext_rows = query(FULLTEXT_QUERY, {**params, "index": FULLTEXT_INDEX, "lucene": lucene}) if lucene else []
+
+    merged = _normalized(fulltext_rows)
+    for nid, hit in _normalized(vector_rows).items():
+        if nid not in merged or hit["score"] > merged[nid]["score"]:
+            merged[nid] = hit
+    hits = sorted(merged.values(), key=lambda h: (-h["score"], h["node"]["id"]))[:top_k]
+    source_store.hydrate(h["node"] for h in hits)
+
+    print(f"Retrieved {len(hits)} nodes from {repo} ({len(vector_rows)} vector"
+          f"{' exact' if exact else ''}, {len(fulltext_rows)} fulltext) in {time.time() - started:.2f}s")
+    return hits
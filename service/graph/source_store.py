@@ -0,0 +1,117 @@
+from functools import lru_cache
+from typing import Dict, Iterable, List
+from dotenv import load_dotenv
+from .neo4j_conn import query
+import hashlib
+import mmap
+import os
+import time
+
+load_dotenv()
+
+SOURCE_STORE_PATH = os.getenv("SOURCE_STORE_PATH", "./source_store")
+# blobs kept memory-mapped at once
+SOURCE_STORE_OPEN_FILES = int(os.getenv("SOURCE_STORE_OPEN_FILES", "256"))
+SNIPPET_MAX_LEN = int(os.getenv("SNIPPET_MAX_LEN", "250"))
+
+
+def content_hash(data: bytes) -> str:
+    """Same sha256 as repo_utils.file_hash, which is what File.content_hash holds."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _blob_path(key: str) -> str:
+    return os.path.join(SOURCE_STORE_PATH, key[:2], key)
+
+
+def put(key: str, data: bytes):
+    """Store one file revision's bytes under its content hash (no-op if already stored)."""
+    path = _blob_path(key)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write-then-rename so concurrent writers and readers never see a partial blob
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+@lru_cache(maxsize=SOURCE_STORE_OPEN_FILES)
+def _open(key: str):
+    # a missing blob raises FileNotFoundError, which lru_cache does not remember,
+    # so a blob written again later (same content, same key) is found
+    with open(_blob_path(key), "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def snippet(key: str, start_byte: int, end_byte: int, max_len: int = None):
+    """Decoded source text of a byte range of a stored revision, or None if the blob is gone."""
+    if key is None or start_byte is None or end_byte is None:
+        return None
+    try:
+        blob = _open(key)
+    except FileNotFoundError:
+        return None
+    max_len = max_len or SNIPPET_MAX_LEN
+    # utf-8 is at most 4 bytes per char; no need to decode more than that
+    end = min(end_byte, start_byte + 4 * max_len)
+    return blob[start_byte:end].decode(errors="ignore")[:max_len]
+
+
+def hydrate(nodes: Iterable[Dict], max_len: int = None) -> List[Dict]:
+    """
+    Fill `text` of node maps that carry a byte range (`start_byte`,
+    `end_byte`) and their file's `hash` instead of inline text. Nodes
+    that already have text (ingested before the store existed) are kept.
+    """
+    nodes = list(nodes)
+    for n in nodes:
+        if not n.get("text"):
+            n["text"] = snippet(n.get("hash"), n.get("start_byte"), n.get("end_byte"), max_len)
+    return nodes
+
+
+def load_snippets(ids: List[int], max_len: int = None) -> Dict[int, str]:
+    """Source text of AST nodes by id, for rendering reports."""
+    rows = query("""
+        UNWIND $ids AS id
+        MATCH (n:AstNode {id: id})
+        OPTIONAL MATCH (f:File {repo: n.repo, path: n.file})
+        RETURN n.id AS id, n.text AS text, n.start_byte AS start_byte, n.end_byte AS end_byte,
+               f.content_hash AS hash
+    """, {"ids": ids})
+    return {n["id"]: n["text"] for n in hydrate(rows, max_len) if n["text"]}
+
+
+def prune(live: Iterable[str], min_age: float = 3600) -> int:
+    """
+    Delete blobs whose content hash is not in `live` (no File node refers
+    to them any more). Blobs younger than min_age seconds are kept, since an
+    ingestion still running elsewhere may not have written its File yet.
+    """
+    live = set(live)
+    cutoff = time.time() - min_age
+    removed = 0
+    if not os.path.isdir(SOURCE_STORE_PATH):
+        return 0
+    for shard in os.listdir(SOURCE_STORE_PATH):
+        shard_path = os.path.join(SOURCE_STORE_PATH, shard)
+        if not os.path.isdir(shard_path):
+            continue
+        for name in os.listdir(shard_path):
+            path = os.path.join(shard_path, name)
+            if name not in live and not name.endswith(".tmp") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+    # drop the mappings of deleted blobs so their disk space is freed
+    _open.cache_clear()
+    return removed
+
+
+def prune_unreferenced() -> int:
+    """prune() against every File.content_hash in the graph."""
+    rows = query("MATCH (f:File) WHERE f.content_hash IS NOT NULL RETURN DISTINCT f.content_hash AS hash")
+    return prune(r["hash"] for r in rows)
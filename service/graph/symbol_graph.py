@@ -0,0 +1,237 @@
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+from .ast_util import file_id
+from .neo4j_conn import query, run, write_batches
+import os
+import re
+import time
+
+load_dotenv()
+
+# extract_semantics type -> symbol label
+SYMBOL_KINDS = {"function": "Function", "class_or_type": "Class"}
+
+# An import reference matching more files than this is too ambiguous to link
+MAX_IMPORT_TARGETS = int(os.getenv("IMPORTS_MAX_TARGETS", "3"))
+
+_MODULE_REF = re.compile(r"[A-Za-z0-9_$@./\-]+")
+
+# -----------------------------
+# CYPHER: per-file part of the layer (written with the file's AST, see GraphWriter)
+# -----------------------------
+UPSERT_SYMBOLS = """
+    UNWIND $rows AS s
+    MERGE (sym:Symbol {id: s.id})
+    SET sym.kind = s.kind,
+        sym.name = s.name,
+        sym.file = s.file,
+        sym.signature = s.signature,
+        sym.repo = s.repo,
+        sym.start_line = s.start_line,
+        sym.end_line = s.end_line
+    FOREACH (_ IN CASE WHEN s.kind = 'Function' THEN [1] ELSE [] END | SET sym:Function)
+    FOREACH (_ IN CASE WHEN s.kind = 'Class' THEN [1] ELSE [] END | SET sym:Class)
+    WITH sym, s
+    MATCH (a:AstNode {id: s.id})
+    MERGE (sym)-[:AST_NODE]->(a)
+"""
+
+# the enclosing symbol contains a nested one; the file contains top-level ones
+SYMBOL_CONTAINS = """
+    UNWIND $rows AS s
+    MATCH (sym:Symbol {id: s.id})
+    OPTIONAL MATCH (p:Symbol {id: s.parent})
+    MATCH (f:File {fid: s.fid})
+    WITH sym, coalesce(p, f) AS owner
+    MERGE (owner)-[:CONTAINS]->(sym)
+"""
+
+SYMBOL_DEFINES = """
+    UNWIND $rows AS row
+    MERGE (v:Variable {name: row.var})
+    WITH row, v
+    OPTIONAL MATCH (s:Symbol {id: row.scope})
+    MATCH (f:File {fid: row.fid})
+    WITH v, coalesce(s, f) AS owner
+    MERGE (owner)-[:DEFINES]->(v)
+"""
+
+SYMBOL_USES = """
+    UNWIND $rows AS row
+    MERGE (v:Variable {name: row.var})
+    WITH row, v
+    OPTIONAL MATCH (s:Symbol {id: row.scope})
+    MATCH (f:File {fid: row.fid})
+    WITH v, coalesce(s, f) AS owner
+    MERGE (owner)-[:USES]->(v)
+"""
+
+# -----------------------------
+# CYPHER: repo-wide part (written by the resolution pass)
+# -----------------------------
+SYMBOL_CALLS = """
+    UNWIND $rows AS row
+    MATCH (a:Symbol {id: row.src})
+    MATCH (b:Symbol {id: row.dst})
+    MERGE (a)-[c:CALLS]->(b)
+    SET c.count = row.count
+"""
+
+FILE_CALLS = """
+    UNWIND $rows AS row
+    MATCH (a:File {fid: row.src})
+    MATCH (b:Symbol {id: row.dst})
+    MERGE (a)-[c:CALLS]->(b)
+    SET c.count = row.count
+"""
+
+FILE_IMPORTS = """
+    UNWIND $rows AS row
+    MATCH (a:File {fid: row.src})
+    MATCH (b:File {fid: row.dst})
+    MERGE (a)-[:IMPORTS]->(b)
+"""
+
+
+def symbol_calls(edges: List[Dict], calls: List[Dict]):
+    """
+    Aggregate resolved AST CALLS edges to the symbol layer.
+
+    The caller side is the call site's enclosing symbol (its `scope`), or
+    its File for module-level calls; the callee is the definition itself,
+    whose AST id is also its Symbol id. Returns (symbol rows, file rows) of
+    {src, dst, count}, sorted.
+    """
+    site = {c["id"]: c for c in calls}
+    from_symbols, from_files = Counter(), Counter()
+    for e in edges:
+        call = site[e["caller"]]
+        if call.get("scope") is not None:
+            if call["scope"] != e["callee"]:
+                from_symbols[(call["scope"], e["callee"])] += 1
+        else:
+            from_files[(call["fid"], e["callee"])] += 1
+    rows = lambda counts: [{"src": s, "dst": d, "count": n} for (s, d), n in sorted(counts.items())]
+    return rows(from_symbols), rows(from_files)
+
+
+def _module_keys(path: str) -> List[str]:
+    # "service/utils/repo_utils.py" -> service.utils.repo_utils, utils.repo_utils, repo_utils
+    parts = os.path.splitext(path)[0].replace("\\", "/").split("/")
+    return [".".join(parts[i:]) for i in range(len(parts))]
+
+
+def _import_refs(text: str) -> set:
+    """Module references in an import statement, as dotted paths ("./a/b.js" -> "a.b")."""
+    refs = set()
+    for token in _MODULE_REF.findall(text or ""):
+        token = re.sub(r"^(\.\.?/)+", "", token).replace("/", ".").strip(".")
+        if token:
+            refs.add(token)
+            # "pkg.mod.Name" imports Name from pkg.mod; "a.b.js" is a file a/b.js
+            if "." in token:
+                refs.add(token.rsplit(".", 1)[0])
+    return refs
+
+
+def resolve_imports(files: List[Dict], imports: List[Dict]) -> List[Dict]:
+    """
+    File -> File IMPORTS edges. `files` are {fid, file} and `imports` the
+    {file, text} of import statements. A reference links to the files whose
+    module path ends with it, if there are at most MAX_IMPORT_TARGETS.
+    """
+    by_key = defaultdict(set)
+    fids = {}
+    for f in files:
+        fids[f["file"]] = f["fid"]
+        for key in _module_keys(f["file"]):
+            by_key[key].add(f["fid"])
+
+    edges = set()
+    for imp in imports:
+        src = fids.get(imp["file"])
+        if src is None:
+            continue
+        for ref in _import_refs(imp["text"]):
+            targets = by_key.get(ref, ())
+            if len(targets) <= MAX_IMPORT_TARGETS:
+                edges.update((src, dst) for dst in targets if dst != src)
+    return [{"src": s, "dst": d} for s, d in sorted(edges)]
+
+
+def importers_of(imports: List[Dict], changed: Iterable[str]) -> List[Dict]:
+    """The import statements that live in `changed` files or may refer to one of them."""
+    changed = set(changed)
+    keys = {k for path in changed for k in _module_keys(path)}
+    return [imp for imp in imports if imp["file"] in changed or _import_refs(imp["text"]) & keys]
+
+
+def link_symbol_layer(repo_name: str, edges: List[Dict], calls: List[Dict], imports: List[Dict],
+                      files: Optional[List[str]] = None, names: Iterable[str] = ()):
+    """
+    Rebuild the repo-wide symbol edges: symbol / file CALLS aggregated from
+    the resolved AST CALLS edges, and file IMPORTS. Called by
+    resolve_repo_calls once the whole repo is ingested.
+
+    With `files` (an incremental run's changed and removed paths) `edges`
+    and `calls` only cover the re-resolved call sites, so only the CALLS
+    edges those sites produce are replaced: the ones leaving the files and
+    the ones into symbols named one of `names`. IMPORTS are redone for the
+    files and for those whose imports may refer to one of them.
+    """
+    started = time.time()
+    repo_files = query("""
+        MATCH (f:File {repo: $repo})
+        RETURN f.fid AS fid, f.path AS file
+    """, {"repo": repo_name})
+    from_symbols, from_files = symbol_calls(edges, calls)
+
+    if files is None:
+        imports = resolve_imports(repo_files, imports)
+        run("""
+            MATCH (:Symbol {repo: $repo})-[c:CALLS]->()
+            DELETE c
+        """, {"repo": repo_name})
+        run("""
+            MATCH (:File {repo: $repo})-[c:CALLS|IMPORTS]->()
+            DELETE c
+        """, {"repo": repo_name})
+    else:
+        # cheap text prefilter on module names; importers_of does the exact match
+        stems = sorted({os.path.splitext(os.path.basename(f))[0] for f in files})
+        candidates = query("""
+            MATCH (n:AstNode {repo: $repo, semantic_type: 'import_statement'})
+            WHERE n.file IN $files OR any(stem IN $stems WHERE n.text CONTAINS stem)
+            RETURN n.file AS file, n.text AS text
+        """, {"repo": repo_name, "files": list(files), "stems": stems})
+        scoped = importers_of(candidates, files)
+        imports = resolve_imports(repo_files, scoped)
+        run("""
+            MATCH (s:Symbol {repo: $repo})
+            WHERE s.file IN $files
+            MATCH (s)-[c:CALLS]->()
+            DELETE c
+        """, {"repo": repo_name, "files": list(files)})
+        run("""
+            MATCH (s:Symbol {repo: $repo})
+            WHERE s.name IN $names
+            MATCH (:Symbol|File)-[c:CALLS]->(s)
+            DELETE c
+        """, {"repo": repo_name, "names": sorted(names)})
+        run("""
+            UNWIND $fids AS fid
+            MATCH (:File {fid: fid})-[c:CALLS]->()
+            DELETE c
+        """, {"fids": [file_id(repo_name, f) for f in files]})
+        run("""
+            UNWIND $fids AS fid
+            MATCH (:File {fid: fid})-[c:IMPORTS]->()
+            DELETE c
+        """, {"fids": sorted({file_id(repo_name, imp["file"]) for imp in scoped})})
+    write_batches(SYMBOL_CALLS, from_symbols)
+    write_batches(FILE_CALLS, from_files)
+    write_batches(FILE_IMPORTS, imports)
+
+    print(f"✔ Symbol layer of {repo_name}: {len(from_symbols) + len(from_files)} CALLS, "
+          f"{len(imports)} IMPORTS ({time.time() - started:.1f}s)")
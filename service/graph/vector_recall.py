@@ -0,0 +1,101 @@
+from typing import Dict, List
+from dotenv import load_dotenv
+from .embeddings import embed_texts
+from .neo4j_conn import query, EMBEDDING_STORAGE, VECTOR_QUANTIZATION
+from . import source_store
+from .retrieval import VECTOR_INDEX, VECTOR_QUERY, EXACT_VECTOR_QUERY, RETRIEVAL_OVERSAMPLE
+import argparse
+import json
+import time
+
+load_dotenv()
+
+
+def sample_queries(repo_name: str, n: int) -> List[str]:
+    """
+    Up to n query texts for the repo: the inputs of its past analyses
+    (newest first), topped up with texts of randomly sampled embedded nodes.
+    """
+    from database import SessionLocal
+    from models import AnalysisReport, Repository
+
+    db = SessionLocal()
+    try:
+        texts = [r.input for r in db.query(AnalysisReport)
+                 .join(Repository, Repository.id == AnalysisReport.repo_id)
+                 .filter(Repository.name == repo_name, AnalysisReport.input.isnot(None))
+                 .order_by(AnalysisReport.id.desc()).limit(n)]
+    finally:
+        db.close()
+
+    if len(texts) < n:
+        sampled = source_store.hydrate(query("""
+            MATCH (node:AstNode {repo: $repo})
+            WHERE node.embedding IS NOT NULL
+            WITH node ORDER BY rand() LIMIT $n
+            OPTIONAL MATCH (f:File {repo: node.repo, path: node.file})
+            RETURN node.text AS text, node.start_byte AS start_byte, node.end_byte AS end_byte,
+                   f.content_hash AS hash
+        """, {"repo": repo_name, "n": n - len(texts)}))
+        texts += [r["text"] for r in sampled if r["text"]]
+    return texts
+
+
+def _timed(cypher: str, params: Dict):
+    started = time.time()
+    rows = query(cypher, params)
+    return [r["node"]["id"] for r in rows], time.time() - started
+
+
+def measure_recall(repo_name: str, n_queries: int = 50, k: int = 20, oversample: int = None) -> Dict:
+    """
+    Recall@k of the (quantized) ANN index against exact full-precision
+    cosine search over the repo, with and without rescoring the ANN
+    candidates, plus mean latency of each.
+    """
+    texts = sample_queries(repo_name, n_queries)
+    vectors = embed_texts(texts)
+    params = {"repo": repo_name, "top_k": k, "candidates": k * (oversample or RETRIEVAL_OVERSAMPLE),
+              "path_prefix": None, "semantic_types": None, "index": VECTOR_INDEX}
+
+    totals = {"ann": [0.0, 0.0], "rescored": [0.0, 0.0], "exact": [0.0, 0.0]}
+    measured = 0
+    for text in texts:
+        vector = vectors.get(text)
+        if vector is None:
+            continue
+        exact, seconds = _timed(EXACT_VECTOR_QUERY, {**params, "vector": vector})
+        if not exact:
+            continue
+        totals["exact"][1] += seconds
+        for name, rescore in (("ann", False), ("rescored", True)):
+            ids, seconds = _timed(VECTOR_QUERY, {**params, "vector": vector, "rescore": rescore})
+            totals[name][0] += len(set(ids) & set(exact)) / len(exact)
+            totals[name][1] += seconds
+        measured += 1
+
+    per_query = lambda v: round(v / measured, 4) if measured else None
+    return {
+        "repo": repo_name,
+        "queries": measured,
+        "k": k,
+        "oversample": oversample or RETRIEVAL_OVERSAMPLE,
+        "embedding_storage": EMBEDDING_STORAGE,
+        "index_quantization": VECTOR_QUANTIZATION,
+        "recall_ann": per_query(totals["ann"][0]),
+        "recall_rescored": per_query(totals["rescored"][0]),
+        "seconds_exact": per_query(totals["exact"][1]),
+        "seconds_ann": per_query(totals["ann"][1]),
+        "seconds_rescored": per_query(totals["rescored"][1]),
+    }
+
+
+if __name__ == "__main__":
+    # python -m service.graph.vector_recall <repo> [--queries 50] [--k 20] [--oversample 10]
+    parser = argparse.ArgumentParser(description="Recall loss of the vector index against exact cosine search")
+    parser.add_argument("repo")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--oversample", type=int, default=None)
+    args = parser.parse_args()
+    print(json.dumps(measure_recall(args.repo, args.queries, args.k, args.oversample), indent=2))
@@ -0,0 +1,260 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from .parser.ts_parser import parse_file
+from .graph.ast_with_embeddings import collect_code_graph
+from .graph.graph_writer import GraphWriter
+from .graph.neo4j_conn import ensure_schema
+from .graph.embeddings import attach_embeddings
+from .graph import source_store
+from .metrics import inc, observe, set_gauge, span
+from dotenv import load_dotenv
+import os
+import queue
+import threading
+import time
+import traceback
+
+load_dotenv()
+
+# -----------------------------
+# PIPELINE CONFIG
+# -----------------------------
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(os.cpu_count() or 1)))
+EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "2"))
+WRITE_WORKERS = int(os.getenv("INGEST_WRITE_WORKERS", "1"))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "64"))
+# How many parsed files one embedding call may group together
+EMBED_FILES_PER_BATCH = int(os.getenv("INGEST_EMBED_FILES_PER_BATCH", "8"))
+# Seconds between progress callbacks (files parsed / embeddings / files written so far)
+PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", "0.5"))
+
+_DONE = object()
+_stats_lock = threading.Lock()
+
+
+def _count(stats: dict, key: str, amount: int = 1):
+    with _stats_lock:
+        stats[key] += amount
+
+
+def extract_file(repo_name: str, repo_path: str, file_path: str, content_hash: str = None):
+    """
+    Parse + semantic extraction for one file, and the file's bytes into the
+    source store (nodes only keep byte ranges). Runs inside a worker process,
+    so stage timings travel back on the records for the parent to record.
+    """
+    started = time.time()
+    parsed = parse_file(file_path)
+    if isinstance(parsed, dict):
+        return {"file": file_path, "error": parsed.get("error")}
+    tree, code = parsed
+    parsed_at = time.time()
+    content_hash = content_hash or source_store.content_hash(code)
+    source_store.put(content_hash, code)
+    records = collect_code_graph(repo_name, os.path.relpath(file_path, repo_path), tree, code, content_hash)
+    records["timings"] = {"parse": parsed_at - started, "collect": time.time() - parsed_at}
+    return records
+
+
+def _record_file(records: dict):
+    for stage, seconds in records.pop("timings", {}).items():
+        observe("impact_stage_seconds", seconds, stage=stage)
+    observe("impact_file_nodes", len(records["nodes"]))
+    observe("impact_file_edges", len(records["child"]) + len(records["defs"]) + len(records["uses"]))
+
+
+def _progress(stats: dict, total: int) -> dict:
+    with _stats_lock:
+        return {"total": total, "parsed": stats["parsed"], "embedded": stats["embedded"],
+                "written": stats["written"], "failed": len(stats["failed"])}
+
+
+def _report_progress(stats: dict, total: int, on_progress, stop: threading.Event):
+    # Polls the shared counters, so the stages never wait on the callback
+    last = None
+    while not stop.wait(PROGRESS_INTERVAL):
+        snapshot = _progress(stats, total)
+        if snapshot != last:
+            last = snapshot
+            try:
+                on_progress(snapshot)
+            except Exception as e:
+                print(f"Progress callback failed: {e}")
+
+
+def _drain(inbox: queue.Queue, stats: dict, reason: str):
+    # A stage that can no longer work still consumes its inbox, so upstream never blocks on a full queue
+    while True:
+        records = inbox.get()
+        if records is _DONE:
+            inbox.put(_DONE)
+            return
+        stats["failed"].append((records["file"], reason))
+
+
+def _guarded(stage, name: str, inbox: queue.Queue, stats: dict, *args):
+    """Run a stage thread; if it dies (e.g. its writer cannot be created), fail the files still queued for it."""
+    try:
+        stage(inbox, *args)
+    except Exception as e:
+        traceback.print_exc()
+        _drain(inbox, stats, f"{name} stage failed: {e}")
+
+
+def _embed_stage(inbox: queue.Queue, outbox: queue.Queue, stats: dict):
+    while True:
+        item = inbox.get()
+        set_gauge("impact_queue_depth", inbox.qsize(), queue="embed")
+        if item is _DONE:
+            inbox.put(_DONE)  # let sibling workers see it too
+            return
+
+        # Group whatever else is already waiting so one embedding pass covers several files
+        batch = [item]
+        while len(batch) < EMBED_FILES_PER_BATCH:
+            try:
+                nxt = inbox.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is _DONE:
+                inbox.put(_DONE)
+                break
+            batch.append(nxt)
+
+        try:
+            nodes = [n for records in batch for n in records["nodes"]]
+            with span("embed", files=len(batch), nodes=len(nodes)):
+                _count(stats, "embedded", attach_embeddings(nodes))
+        except Exception as e:
+            for records in batch:
+                stats["failed"].append((records["file"], f"embedding failed: {e}"))
+            continue
+        for records in batch:
+            outbox.put(records)
+
+
+def _write_stage(inbox: queue.Queue, stats: dict, sink_factory):
+    # Each writer batches several files per flush. For GraphWriter that is one
+    # transaction, which also drops the stale nodes of modified files.
+    writer = sink_factory()
+
+    def flush():
+        batch = writer.pending
+        try:
+            with span("write", files=len(batch)):
+                writer.flush()
+        except Exception as e:
+            writer.pending = []
+            for records in batch:
+                stats["failed"].append((records["file"], f"write failed: {e}"))
+            return
+        _count(stats, "written", len(batch))
+        _count(stats, "nodes", sum(len(r["nodes"]) for r in batch))
+
+    while True:
+        records = inbox.get()
+        set_gauge("impact_queue_depth", inbox.qsize(), queue="write")
+        if records is _DONE:
+            inbox.put(_DONE)
+            flush()
+            return
+        writer.pending.append(records)
+        if len(writer.pending) >= writer.batch_files:
+            flush()
+
+
+def run_pipeline(repo_name: str, repo_path: str, files: list, hashes: dict = None,
+                 parse_workers: int = None, embed_workers: int = None,
+                 write_workers: int = None, queue_size: int = None,
+                 sink_factory=GraphWriter, on_progress=None) -> dict:
+    """
+    Ingest `files` (absolute paths under `repo_path`) through three concurrent stages:
+
+    parse/extract (process pool) -> embed (threads) -> Neo4j write (threads)
+
+    Stages are connected by bounded queues, so a slow embedder or database
+    throttles parsing instead of piling records up in memory. Per-file
+    failures are collected and reported rather than aborting the run.
+
+    `sink_factory` builds one writer per write worker; anything with
+    `pending`, `batch_files` and `flush()` works (GraphWriter writes to
+    Neo4j, BulkImportWriter to neo4j-admin CSVs).
+
+    `on_progress`, if given, is called from a reporter thread every
+    PROGRESS_INTERVAL seconds while the counts change, and once at the end,
+    with {"total", "parsed", "embedded", "written", "failed"}.
+    """
+    hashes = hashes or {}
+    parse_workers = parse_workers or PARSE_WORKERS
+    embed_workers = embed_workers or EMBED_WORKERS
+    write_workers = write_workers or WRITE_WORKERS
+    queue_size = queue_size or QUEUE_SIZE
+
+    stats = {"parsed": 0, "embedded": 0, "written": 0, "nodes": 0, "failed": []}
+    if not files:
+        return stats
+
+    if sink_factory is GraphWriter:
+        ensure_schema()
+    embed_q = queue.Queue(maxsize=queue_size)
+    write_q = queue.Queue(maxsize=queue_size)
+    embedders = [threading.Thread(target=_guarded, args=(_embed_stage, "embed", embed_q, stats, write_q, stats),
+                                  daemon=True)
+                 for _ in range(embed_workers)]
+    writers = [threading.Thread(target=_guarded, args=(_write_stage, "write", write_q, stats, stats, sink_factory),
+                                daemon=True)
+               for _ in range(write_workers)]
+    for t in embedders + writers:
+        t.start()
+    stop_reporting = threading.Event()
+    if on_progress:
+        reporter = threading.Thread(target=_report_progress, args=(stats, len(files), on_progress, stop_reporting),
+                                    daemon=True)
+        reporter.start()
+
+    started = time.time()
+    pending = set()
+    todo = iter(files)
+    with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+        while True:
+            # Keep at most queue_size parse jobs in flight
+            for f in todo:
+                pending.add(pool.submit(extract_file, repo_name, repo_path, f, hashes.get(f)))
+                if len(pending) >= queue_size:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    records = fut.result()
+                except Exception as e:
+                    inc("impact_files_total", result="failed")
+                    stats["failed"].append(("<worker>", f"parse failed: {e}"))
+                    continue
+                if "error" in records:
+                    inc("impact_files_total", result="failed")
+                    stats["failed"].append((records["file"], records["error"]))
+                    continue
+                _record_file(records)
+                inc("impact_files_total", result="parsed")
+                _count(stats, "parsed")
+                embed_q.put(records)  # blocks when the embedders fall behind
+
+    embed_q.put(_DONE)
+    for t in embedders:
+        t.join()
+    write_q.put(_DONE)
+    for t in writers:
+        t.join()
+    if on_progress:
+        stop_reporting.set()
+        reporter.join()
+        on_progress(_progress(stats, len(files)))
+
+    elapsed = time.time() - started
+    print(f"Pipeline: {stats['parsed']} parsed, {stats['written']} written, {stats['nodes']} nodes, "
+          f"{stats['embedded']} embedded, {len(stats['failed'])} failed in {elapsed:.1f}s "
+          f"({stats['written'] / elapsed if elapsed else 0:.1f} files/s)")
+    for f, err in stats["failed"]:
+        print("Failed", f, err)
+    return stats
@@ -1,19 +1,128 @@
-from .utils.repo_utils import clone_repo, list_source_files
-from .parser.ts_parser import parse_file
-from .graph.ast_with_embeddings import upsert_code_graph
+from .utils.repo_utils import list_source_files, file_hash, head_commit, changed_files
+from .graph.ast_with_embeddings import get_file_hashes, get_last_commit, set_last_commit, remove_file_graph
+from .graph.call_resolver import resolve_repo_calls, defined_names
+from .graph.bulk_import import BulkImportWriter
+from .graph import source_store
+from .ingest_pipeline import run_pipeline
+from .metrics import span
 from dotenv import load_dotenv
-import os   
+import os
 load_dotenv()
 
 LOCAL_PATH=os.getenv("LOCAL_REPO_PATH")
 
 
-def initiate_graph(REPO_NAME:str):
-    files = list_source_files(LOCAL_PATH)
-    print(files)
-    for f in files:
-        print("Parsing", f)
-        tree, code = parse_file(f)
-        upsert_code_graph(REPO_NAME, f, tree, code)
+def plan_ingestion(REPO_NAME: str, repo_path: str, files: list, incremental: bool = True):
+    """
+    Work out which files need (re-)ingesting and which were deleted.
 
-    print("AST ingestion completed.")
\ No newline at end of file
+    Candidates come from `git diff` against the last ingested commit when that
+    commit is known and still reachable; otherwise every discovered file is a
+    candidate. A candidate is only re-ingested if its content hash differs from
+    the one stored on its File node, so touched-but-identical files are free.
+
+    `files` are absolute paths; the graph keys files by their path relative
+    to `repo_path`. Returns (to_ingest, removed, hashes) with to_ingest and
+    hashes keyed by absolute path and removed as repo-relative paths.
+    """
+    hashes = {}
+    if not incremental:
+        for f in files:
+            hashes[f] = file_hash(f)
+        return files, [], hashes
+
+    known = get_file_hashes(REPO_NAME)
+    last_commit = get_last_commit(REPO_NAME)
+
+    rel = {f: os.path.relpath(f, repo_path) for f in files}
+
+    candidates = files
+    diff = changed_files(repo_path, last_commit) if last_commit else None
+    if diff is not None:
+        candidates = [f for f in files if f in diff or rel[f] not in known]
+
+    to_ingest = []
+    for f in candidates:
+        hashes[f] = file_hash(f)
+        if known.get(rel[f]) != hashes[f]:
+            to_ingest.append(f)
+
+    present = set(rel.values())
+    removed = [p for p in known if p not in present]
+    return to_ingest, removed, hashes
+
+
+def export_bulk_import(REPO_NAME: str, repo_path: str, files: list, commit: str = None):
+    """
+    First-time onboarding of a very large repo: run the parse/embed stages
+    as usual but stream the graph to neo4j-admin import CSVs instead of
+    writing transactions. Prints the offline import command; afterwards
+    run `python -m service.graph.bulk_import finish` to build the indexes.
+    """
+    hashes = {f: file_hash(f) for f in files}
+    writer = BulkImportWriter(REPO_NAME, commit=commit)
+    run_pipeline(REPO_NAME, repo_path, files, hashes, write_workers=1, sink_factory=lambda: writer)
+    command = writer.close()
+    print(f"Bulk import files written to {writer.out_dir}. With Neo4j stopped, run:\n{command}")
+
+
+def initiate_graph(REPO_NAME:str, incremental: bool = True, mode: str = "online", commit: str = None,
+                   on_progress=None):
+    """
+    Ingest a cloned repo. mode="online" upserts (incrementally by default)
+    into the running database; mode="import" writes offline import files.
+    `commit` is the one sync_repo checked out (read from HEAD if not given).
+    `on_progress` receives the pipeline's file and embedding counts (see run_pipeline).
+
+    Returns the (path, error) pairs of files that failed. When any did, the
+    last ingested commit is not moved forward, so the next incremental run
+    diffs from the old commit again and retries them.
+    """
+    repo_path = os.path.join(LOCAL_PATH, REPO_NAME)
+    with span("discover", repo=REPO_NAME):
+        files = list_source_files(repo_path)
+    commit = commit or head_commit(repo_path)
+
+    if mode == "import":
+        export_bulk_import(REPO_NAME, repo_path, files, commit)
+        return []
+
+    to_ingest, removed, hashes = plan_ingestion(REPO_NAME, repo_path, files, incremental)
+    print(f"{len(to_ingest)} changed, {len(removed)} deleted, "
+          f"{len(files) - len(to_ingest)} unchanged files in {REPO_NAME}")
+
+    # An incremental run only re-links calls touching these files (full rebuild when every file changed);
+    # the names they define are read before their old graph is dropped
+    touched = [os.path.relpath(f, repo_path) for f in to_ingest] + removed
+    scoped = incremental and len(to_ingest) < len(files)
+    old_names = defined_names(REPO_NAME, touched) if scoped and touched else set()
+
+    for f in removed:
+        print("Removing", f)
+        remove_file_graph(REPO_NAME, f, delete_file=True)
+
+    with span("ingest", repo=REPO_NAME, files=len(to_ingest)):
+        stats = run_pipeline(REPO_NAME, repo_path, to_ingest, hashes, on_progress=on_progress)
+    failed = stats["failed"]
+
+    # Call graph is linked once every file is in, so it is complete and order-independent
+    if to_ingest or removed:
+        with span("resolve_calls", repo=REPO_NAME, files=len(touched) if scoped else len(files)):
+            if scoped:
+                resolve_repo_calls(REPO_NAME, files=touched, names=old_names)
+            else:
+                resolve_repo_calls(REPO_NAME)
+
+    # Still bumps the graph version (the graph did change), but keeps the old commit
+    set_last_commit(REPO_NAME, None if failed else commit)
+    if failed:
+        print(f"{len(failed)} files failed; {REPO_NAME} stays at its previous commit so they are retried")
+
+    # Blobs of file revisions no File node points at any more
+    if to_ingest or removed:
+        pruned = source_store.prune_unreferenced()
+        if pruned:
+            print(f"Pruned {pruned} unreferenced source blobs")
+
+    print("AST ingestion completed.")
+    return failed
@@ -0,0 +1,186 @@
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from database import SessionLocal
+from models import AnalysisReport
+from service.metrics import set_gauge
+import os
+import socket
+import threading
+import traceback
+import uuid
+
+load_dotenv()
+
+# -----------------------------
+# ANALYSIS JOB QUEUE CONFIG
+# -----------------------------
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+ANALYSIS_PER_REPO = int(os.getenv("ANALYSIS_PER_REPO", "2"))
+ANALYSIS_MAX_QUEUED = int(os.getenv("ANALYSIS_MAX_QUEUED", "50"))
+# How often a server renews the jobs it owns; jobs not renewed for 3 intervals belong to a dead server
+ANALYSIS_HEARTBEAT = float(os.getenv("ANALYSIS_HEARTBEAT", "30"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class AnalysisJobQueue:
+    """
+    Runs impact analyses on a bounded thread pool, off the event loop.
+
+    - at most `workers` analyses run at once
+    - at most `per_repo` of them for the same repo; extra jobs for a busy
+      repo wait in that repo's backlog without holding a worker
+    - once `max_queued` jobs are queued or running, submit() raises QueueFull
+
+    Each job is a row in the reports table, which carries its status,
+    input, result (content) or error and timestamps. `on_event(job_id,
+    repo_id, status, result)` is called from the worker thread on every
+    status change. Jobs only live in the process that queued them: each
+    row records its owner, which renews heartbeat_at while the job is
+    outstanding. Once start() is called, rows still Queued or Running whose
+    owner stopped renewing them (a crashed or restarted worker) are marked
+    Failed; jobs of other live workers are left alone.
+    """
+
+    def __init__(self, run_analysis, on_event=None, workers: int = None,
+                 per_repo: int = None, max_queued: int = None):
+        self.run_analysis = run_analysis
+        self.on_event = on_event
+        self.per_repo = per_repo or ANALYSIS_PER_REPO
+        self.max_queued = max_queued or ANALYSIS_MAX_QUEUED
+        self.pool = ThreadPoolExecutor(max_workers=workers or ANALYSIS_WORKERS,
+                                       thread_name_prefix="analysis")
+        self._lock = threading.Lock()
+        self._running = defaultdict(int)
+        self._backlog = defaultdict(deque)
+        self._outstanding = 0
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stopped = threading.Event()
+        self._lease = None
+
+    def start(self):
+        """Start renewing this queue's jobs and failing those of dead servers."""
+        if self._lease is None:
+            self._lease = threading.Thread(target=self._keep_lease, name="analysis-lease", daemon=True)
+            self._lease.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _keep_lease(self):
+        while True:
+            try:
+                self._renew()
+                self.fail_interrupted()
+            except Exception:
+                traceback.print_exc()
+            if self._stopped.wait(ANALYSIS_HEARTBEAT):
+                return
+
+    def _renew(self):
+        db = SessionLocal()
+        try:
+            db.query(AnalysisReport).filter(
+                AnalysisReport.owner == self.owner, AnalysisReport.status.in_(["Queued", "Running"]),
+            ).update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def fail_interrupted(self) -> int:
+        """Mark jobs whose owner stopped renewing them (or that predate owners) as Failed."""
+        expired = datetime.utcnow() - timedelta(seconds=3 * ANALYSIS_HEARTBEAT)
+        db = SessionLocal()
+        try:
+            count = db.query(AnalysisReport).filter(
+                AnalysisReport.status.in_(["Queued", "Running"]),
+                (AnalysisReport.owner == None) | (AnalysisReport.owner != self.owner),  # noqa: E711
+                (AnalysisReport.heartbeat_at == None) | (AnalysisReport.heartbeat_at < expired),  # noqa: E711
+            ).update(
+                {"status": "Failed", "error": "Interrupted: the server running it stopped",
+                 "finished_at": datetime.utcnow()},
+                synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        if count:
+            print(f"Marked {count} analysis jobs of stopped servers as Failed")
+        return count
+
+    def depth(self) -> int:
+        return self._outstanding
+
+    def submit(self, repo_id: int, type_: str, data: str, **kwargs) -> int:
+        with self._lock:
+            if self._outstanding >= self.max_queued:
+                raise QueueFull(f"{self._outstanding} analyses already queued or running")
+            self._outstanding += 1
+            set_gauge("impact_queue_depth", self._outstanding, queue="analysis")
+
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            job = AnalysisReport(repo_id=repo_id, type=type_, input=data, status="Queued",
+                                 created_at=now, owner=self.owner, heartbeat_at=now)
+            db.add(job)
+            db.commit()
+            job_id = job.id
+        except Exception:
+            with self._lock:
+                self._outstanding -= 1
+                set_gauge("impact_queue_depth", self._outstanding, queue="analysis")
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            self._backlog[repo_id].append((job_id, type_, data, kwargs))
+            self._dispatch(repo_id)
+        self._notify(job_id, repo_id, "Queued")
+        return job_id
+
+    def _dispatch(self, repo_id: int):
+        # caller holds self._lock
+        while self._backlog[repo_id] and self._running[repo_id] < self.per_repo:
+            job = self._backlog[repo_id].popleft()
+            self._running[repo_id] += 1
+            self.pool.submit(self._run, repo_id, *job)
+
+    def _run(self, repo_id: int, job_id: int, type_: str, data: str, kwargs: dict):
+        try:
+            self._update(job_id, status="Running", started_at=datetime.utcnow())
+            self._notify(job_id, repo_id, "Running")
+            try:
+                result = self.run_analysis(repo_id=repo_id, type_=type_, data=data, job_id=job_id, **kwargs)
+            except Exception as e:
+                traceback.print_exc()
+                self._update(job_id, status="Failed", error=str(e), finished_at=datetime.utcnow())
+                self._notify(job_id, repo_id, "Failed", str(e))
+                return
+            self._update(job_id, status="Done", content=result, finished_at=datetime.utcnow())
+            self._notify(job_id, repo_id, "Done", result)
+        finally:
+            with self._lock:
+                self._running[repo_id] -= 1
+                self._outstanding -= 1
+                set_gauge("impact_queue_depth", self._outstanding, queue="analysis")
+                self._dispatch(repo_id)
+
+    def _update(self, job_id: int, **fields):
+        db = SessionLocal()
+        try:
+            db.query(AnalysisReport).filter(AnalysisReport.id == job_id).update(fields)
+            db.commit()
+        finally:
+            db.close()
+
+    def _notify(self, job_id: int, repo_id: int, status: str, result=None):
+        if self.on_event:
+            try:
+                self.on_event(job_id, repo_id, status, result)
+            except Exception:
+                traceback.print_exc()
@@ -1,41 +1,25 @@
-from neo4j import GraphDatabase
-from neo4j_graphrag.retrievers import HybridRetriever
-from neo4j_graphrag.embeddings import OllamaEmbeddings
-from typing import Any
-from neo4j_graphrag.generation import GraphRAG
-from neo4j_graphrag.llm import OllamaLLM
+from service.graph.ast_with_embeddings import get_graph_version, get_last_commit
+from service.graph.diff_mapping import map_diff
+from service.graph.impact_traversal import traverse_impact, format_impact
+from service.graph.retrieval import search
+from service.graph.source_store import load_snippets
+from service.llm.result_cache import cache, normalize_input
+from service.llm.mcp_client import get_mcp_pool
+from service import clients
+from service.metrics import inc, span
+from service.utils.repo_utils import resolve_ref, diff_hunks
+from typing import Any, List
+from neo4j_graphrag.generation.prompts import RagTemplate
 from dotenv import load_dotenv
+import ollama
 import os
-import subprocess
 
 load_dotenv()
 
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USERNAME =  os.getenv("NEO4J_USERNAME")
-NEO4J_PASSWORD =  os.getenv("NEO4J_PASSWORD")
-
-# Connect to the Neo4j database
-print("Connecting to Neo4j at:", NEO4J_URI,NEO4J_PASSWORD,NEO4J_USERNAME)
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
-
-embedder = OllamaEmbeddings(
-    # model="sellerscrisp/jina-embeddings-v4-text-code-q4"
-    model="nomic-embed-text"
-)
-
-retriever = HybridRetriever(
-    driver=driver,
-    vector_index_name="astVectorIndex",
-    fulltext_index_name="astFulltextIndex",
-    embedder=embedder,
-    return_properties=["id", "semantic_type", "name", "file", "text"]
-)
 # LLM
-llm = OllamaLLM(
-    model_name="llama3.1:8b",
-)
-# Initialize the RAG pipeline
-rag = GraphRAG(retriever=retriever, llm=llm)
+LLM_MODEL = "llama3.1:8b"
+# Same prompt GraphRAG builds for the first answer
+prompt_template = RagTemplate()
 
 def get_query_prompt(prompt_type='embed',data:str='',is_fr:bool=True) -> str:
     if prompt_type=='embed':
@@ -146,31 +130,258 @@ def get_query_prompt(prompt_type='embed',data:str='',is_fr:bool=True) -> str:
     return sanitize_query(query_text)
 
 
-def run_mcphost(embeddings_output):
-    command = [
-        os.path.expanduser("~/go/bin/mcphost"),
-        "-m", "ollama:llama3.1:8b",
-        "--config", os.path.expanduser("./local.json"),
-        "-p", f"analyse impact from neo4j ASTnode based on the based on the modules listed and provide a readme.md as output {embeddings_output}",
-        "--quiet"
+MCP_MAX_TOOL_STEPS = int(os.getenv("MCP_MAX_TOOL_STEPS", "8"))
+# "traversal": graph-native impact expansion + one LLM write-up; "llm": answer + MCP Cypher agent
+IMPACT_ENGINE = os.getenv("IMPACT_ENGINE", "traversal")
+# chat client for the write-up and the MCP agent, built on first use
+clients.register("llm", ollama.Client)
+
+def _emit(on_event, event: str, **fields):
+    if on_event:
+        on_event({"event": event, **fields})
+
+def stream_chat(messages: list, stage: str, on_event=None, tools: list = None) -> dict:
+    """
+    ollama chat with stream=True: every content delta is emitted as a
+    "token" event while the reply is assembled; returns the full message.
+    """
+    content, tool_calls = [], []
+    with span("llm", stage=stage):
+        for chunk in clients.get("llm").chat(model=LLM_MODEL, messages=messages, tools=tools, stream=True):
+            delta = chunk.message.content
+            if delta:
+                content.append(delta)
+                inc("impact_llm_tokens_total", stage=stage)
+                _emit(on_event, "token", stage=stage, delta=delta)
+            if chunk.message.tool_calls:
+                tool_calls.extend(chunk.message.tool_calls)
+    return {"role": "assistant", "content": "".join(content), "tool_calls": tool_calls}
+
+def run_mcp_agent(embeddings_output, on_event=None):
+    """
+    In-process replacement for the mcphost CLI: llama3.1 with the Cypher MCP
+    server's tools, called through the shared session pool, until the model
+    stops requesting tools (or MCP_MAX_TOOL_STEPS is reached). Replies are
+    streamed to on_event as "report" tokens.
+    """
+    tools = [{
+        "type": "function",
+        "function": {"name": t.name, "description": t.description or "", "parameters": t.inputSchema},
+    } for t in get_mcp_pool().list_tools()]
+    messages = [{
+        "role": "user",
+        "content": f"analyse impact from neo4j ASTnode based on the based on the modules listed and provide a readme.md as output {embeddings_output}",
+    }]
+
+    for _ in range(MCP_MAX_TOOL_STEPS):
+        message = stream_chat(messages, "report", on_event, tools=tools)
+        messages.append(message)
+        if not message["tool_calls"]:
+            return message["content"]
+        for call in message["tool_calls"]:
+            _emit(on_event, "tool_call", stage="report", tool=call.function.name)
+            try:
+                with span("mcp_tool", tool=call.function.name):
+                    output = get_mcp_pool().call_tool(call.function.name, dict(call.function.arguments))
+            except Exception as e:
+                output = f"Tool call failed: {e}"
+            messages.append({"role": "tool", "content": output, "tool_name": call.function.name})
+
+    # Out of tool steps: ask for the write-up with what has been gathered
+    return stream_chat(messages, "report", on_event)["content"]
+
+def retrieve_context(query_text: str, top_k: int, repo: str = None, path_prefix: str = None,
+                     semantic_types: List[str] = None) -> dict:
+    """
+    Repo-scoped hybrid retrieval (see service.graph.retrieval): the formatted
+    content of the top_k hits, how many distinct files they come from, and
+    (node id, score) seeds for the traversal engine.
+    """
+    with span("retrieval", repo=repo, top_k=top_k):
+        hits = search(query_text, repo, top_k, path_prefix=path_prefix, semantic_types=semantic_types)
+    return {
+        "context": [str(h) for h in hits],
+        "files": len({h["node"]["file"] for h in hits}),
+        "seeds": [(h["node"]["id"], h["score"]) for h in hits],
+    }
+
+def generate_answer(query_text: str, context: list, on_event=None) -> str:
+    """Generation half of GraphRAG.search, using the same prompt template, streamed as "answer" tokens."""
+    prompt = prompt_template.format(query_text=query_text, context="\n".join(context), examples="")
+    messages = [
+        {"role": "system", "content": prompt_template.system_instructions},
+        {"role": "user", "content": prompt},
     ]
+    return stream_chat(messages, "answer", on_event)["content"]
 
-    result = subprocess.run(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
+# impacted functions whose source is shown to the write-up
+REPORT_SNIPPETS = int(os.getenv("REPORT_SNIPPETS", "10"))
 
-    if result.returncode != 0:
-        raise Exception(f"Error executing mcphost: {result.stderr}")
+def write_impact_report(data: str, impact: dict, is_fr: bool = True, on_event=None) -> str:
+    """Single LLM call that writes up a computed impact set; streamed as "report" tokens."""
+    kind = "Feature Request" if is_fr else "Pull Request"
+    top = impact["functions"][:REPORT_SNIPPETS]
+    snippets = load_snippets([f["id"] for f in top]) if top else {}
+    code = "\n".join(f"--- {f['name']} in {f['file']}\n{snippets[f['id']]}" for f in top if f["id"] in snippets)
+    prompt = f'''
+    You are an expert software-impact analyst. The impact of the {kind} below has
+    already been computed from the code graph (reverse call, reference and data-flow
+    dependencies, scored by distance from the change). Write a readme.md impact report:
+    a short summary, then the impacted files, classes and functions grouped by how
+    directly they are affected, with the risk each carries and what to test.
+    Only mention entities from the computed impact set.
 
-    return result.stdout
+    {kind}:
+    "{data}"
 
-def analyze_impact(is_fr:bool=True,data: str='',top_k:int=300):
-    response = rag.search(query_text=get_query_prompt(data=data,is_fr=is_fr), retriever_config={"top_k": top_k})
-    print(response.answer)
-    resp = run_mcphost(get_query_prompt(prompt_type='test',data=response.answer,is_fr=is_fr))
-    
+    Computed impact set:
+    {format_impact(impact)}
+
+    Source of the most impacted functions:
+    {code or "(not available)"}
+    '''
+    return stream_chat([{"role": "user", "content": prompt}], "report", on_event)["content"]
+
+def analyze_impact(is_fr:bool=True,data: str='',top_k:int=300,repo:str=None,on_event=None,engine:str=None,
+                   path_prefix:str=None,semantic_types:List[str]=None):
+    """
+    Retrieval -> impact -> report. With engine="traversal" (IMPACT_ENGINE) the
+    impact set is expanded deterministically over the graph (see
+    impact_traversal) and the LLM only writes it up; with engine="llm" a first
+    LLM answer is handed to the MCP tool-calling agent.
+
+    Retrieval only sees `repo`'s nodes, optionally narrowed to files under
+    path_prefix and to semantic_types.
+
+    Each stage is cached under (repo, graph version, normalized input), so a
+    resubmitted FR skips every stage it already has and re-ingesting the repo
+    invalidates it all.
+
+    on_event, if given, receives progress dicts as they happen:
+      {"event": "stage", "stage": "retrieval"|"traversal"|"answer"|"report", "cached": bool}
+      {"event": "retrieval", "nodes": n, "files": n}
+      {"event": "traversal", "functions": n, "classes": n, "files": n, "depth": n}
+      {"event": "token", "stage": "answer"|"report", "delta": "..."}
+      {"event": "tool_call", "stage": "report", "tool": name}
+    The final report is the return value.
+    """
+    engine = engine or IMPACT_ENGINE
+    version = get_graph_version(repo) if repo else None
+    key = (repo, version, normalize_input(data), is_fr, top_k, engine,
+           path_prefix, tuple(sorted(semantic_types or ())))
+
+    report = cache.get(key, "report")
+    if report is not None:
+        _emit(on_event, "stage", stage="report", cached=True)
+        return report
+
+    query_text = get_query_prompt(data=data,is_fr=is_fr)
+
+    def retrieval_stage():
+        retrieval = cache.get(key, "retrieval")
+        _emit(on_event, "stage", stage="retrieval", cached=retrieval is not None)
+        if retrieval is None:
+            retrieval = retrieve_context(query_text, top_k, repo, path_prefix, semantic_types)
+            cache.put(key, "retrieval", retrieval)
+        _emit(on_event, "retrieval", nodes=len(retrieval["context"]), files=retrieval["files"])
+        return retrieval
+
+    if engine == "traversal":
+        impact = cache.get(key, "impact")
+        if impact is None:
+            seeds = retrieval_stage()["seeds"]
+            _emit(on_event, "stage", stage="traversal", cached=False)
+            with span("traversal", repo=repo, seeds=len(seeds)):
+                impact = traverse_impact(repo, seeds)
+            cache.put(key, "impact", impact)
+        else:
+            _emit(on_event, "stage", stage="traversal", cached=True)
+        _emit(on_event, "traversal", functions=len(impact["functions"]), classes=len(impact["classes"]),
+              files=len(impact["files"]), depth=impact["stats"]["depth"])
+
+        _emit(on_event, "stage", stage="report", cached=False)
+        resp = write_impact_report(data, impact, is_fr, on_event)
+        cache.put(key, "report", resp)
+        return resp
+
+    answer = cache.get(key, "answer")
+    if answer is None:
+        retrieval = retrieval_stage()
+        _emit(on_event, "stage", stage="answer", cached=False)
+        answer = generate_answer(query_text, retrieval["context"], on_event)
+        cache.put(key, "answer", answer)
+    else:
+        _emit(on_event, "stage", stage="answer", cached=True)
+        _emit(on_event, "token", stage="answer", delta=answer)
+    print(answer)
+
+    _emit(on_event, "stage", stage="report", cached=False)
+    resp = run_mcp_agent(get_query_prompt(prompt_type='test',data=answer,is_fr=is_fr), on_event)
+    cache.put(key, "report", resp)
     return resp
 
+# Where a PR's head commit is fetched from when only its number is given
+# (GitHub: pull/<n>/head, GitLab: merge-requests/<n>/head)
+PR_HEAD_REF = os.getenv("PR_HEAD_REF", "pull/{pr}/head")
+
+def describe_changes(pr: str, merge_base: str, head: str, mapped: dict) -> str:
+    """Plain-text summary of a mapped diff, the "input" of a PR write-up."""
+    lines = [f"PR {pr}: {merge_base[:10]}..{head[:10]}", "Changed definitions:"]
+    lines += [f"- {c['name'] or c['kind'] or 'module code'} in {c['file']} (lines {c['lines'][0]}-{c['lines'][1]})"
+              for c in mapped["changed"]]
+    for label in ("added", "unmapped", "stale"):
+        if mapped[label]:
+            lines.append(f"{label.capitalize()} files: {', '.join(mapped[label])}")
+    return "\n".join(lines)
+
+def analyze_pr(pr: str, repo: str, repo_path: str, base_ref: str = None, head_ref: str = None,
+               write_up: bool = True, on_event=None) -> str:
+    """
+    Diff -> impact -> report for a pull request, without retrieval or a
+    first LLM answer: the lines `head_ref` (default PR_HEAD_REF for `pr`)
+    changes since its merge base with `base_ref` (default: the commit the
+    graph was ingested at) are mapped onto AST nodes (see diff_mapping) and
+    those exact nodes seed the traversal. With write_up=False the plain
+    impact set is returned instead of an LLM report, for CI gates.
+
+    Cached per (repo, graph version, merge base, head). Events as for
+    analyze_impact, with {"event": "diff", "files": n, "seeds": n} and a
+    "diff" stage instead of retrieval.
+    """
+    version = get_graph_version(repo)
+    _emit(on_event, "stage", stage="diff", cached=False)
+    with span("diff", repo=repo, pr=pr):
+        base = resolve_ref(repo_path, base_ref or get_last_commit(repo) or "HEAD")
+        head = resolve_ref(repo_path, head_ref or PR_HEAD_REF.format(pr=pr))
+        merge_base, files = diff_hunks(repo_path, base, head)
+    key = (repo, version, "PR", merge_base, head, write_up)
+
+    report = cache.get(key, "report")
+    if report is not None:
+        _emit(on_event, "stage", stage="report", cached=True)
+        return report
+
+    mapped = cache.get(key, "diff")
+    if mapped is None:
+        with span("diff_mapping", repo=repo, files=len(files)):
+            mapped = map_diff(repo, repo_path, merge_base, files)
+        cache.put(key, "diff", mapped)
+    _emit(on_event, "diff", files=len(files), seeds=len(mapped["seeds"]))
+
+    impact = cache.get(key, "impact")
+    _emit(on_event, "stage", stage="traversal", cached=impact is not None)
+    if impact is None:
+        with span("traversal", repo=repo, seeds=len(mapped["seeds"])):
+            impact = traverse_impact(repo, mapped["seeds"])
+        cache.put(key, "impact", impact)
+    _emit(on_event, "traversal", functions=len(impact["functions"]), classes=len(impact["classes"]),
+          files=len(impact["files"]), depth=impact["stats"]["depth"])
+
+    changes = describe_changes(pr, merge_base, head, mapped)
+    if write_up:
+        _emit(on_event, "stage", stage="report", cached=False)
+        resp = write_impact_report(changes, impact, is_fr=False, on_event=on_event)
+    else:
+        resp = f"{changes}\n\n{format_impact(impact)}"
+    cache.put(key, "report", resp)
+    return resp
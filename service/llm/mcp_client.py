@@ -0,0 +1,172 @@
+from datetime import timedelta
+from dotenv import load_dotenv
+from service import clients
+import asyncio
+import json
+import os
+import threading
+
+load_dotenv()
+
+
+def _configured_url():
+    # Same server mcphost used: mcpServers.neo4j.url in local.json
+    try:
+        with open(os.path.join(os.path.dirname(__file__), "..", "..", "local.json")) as f:
+            return json.load(f)["mcpServers"]["neo4j"]["url"]
+    except (OSError, KeyError, ValueError):
+        return "http://localhost:8082/mcp/"
+
+
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL") or _configured_url()
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "4"))
+MCP_TOOL_TIMEOUT = float(os.getenv("MCP_TOOL_TIMEOUT", "60"))
+
+
+class MCPClientPool:
+    """
+    Long-lived, pooled sessions to a streamable-HTTP MCP server.
+
+    Sessions are opened once (on first use) on a private event loop thread
+    and shared by every analysis: a call borrows an idle session, runs the
+    tool with a timeout and returns it. A session whose call fails is
+    closed and replaced in the background. Point `url` (or MCP_SERVER_URL)
+    at a local stub server to test without Neo4j.
+    """
+
+    def __init__(self, url: str = None, size: int = None, timeout: float = None):
+        self.url = url or MCP_SERVER_URL
+        self.size = size or MCP_POOL_SIZE
+        self.timeout = timeout or MCP_TOOL_TIMEOUT
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="mcp-client", daemon=True)
+        self._thread.start()
+        self._start_lock = threading.Lock()
+        self._idle = None
+        self._tools = None
+        # holder task -> its stop event, and pending reconnects; close() winds both down
+        self._holders = {}
+        self._reconnects = set()
+        self._closed = False
+
+    # -----------------------------
+    # session lifecycle (runs on the pool's loop)
+    # -----------------------------
+    async def _hold_session(self, ready: asyncio.Future, stop: asyncio.Event):
+        # the transport's context managers must be entered and exited in the same task;
+        # the SDK is imported here so importing this module stays cheap
+        from mcp import ClientSession
+        from mcp.client.streamable_http import streamablehttp_client
+        try:
+            async with streamablehttp_client(self.url) as (read, write, _):
+                async with ClientSession(read, write, read_timeout_seconds=timedelta(seconds=self.timeout)) as session:
+                    await session.initialize()
+                    ready.set_result(session)
+                    await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+
+    async def _open_session(self):
+        ready = self._loop.create_future()
+        stop = asyncio.Event()
+        holder = self._loop.create_task(self._hold_session(ready, stop))
+        self._holders[holder] = stop
+        holder.add_done_callback(lambda t: self._holders.pop(t, None))
+        session = await ready
+        self._idle.put_nowait((session, stop))
+
+    async def _replace_session(self):
+        delay = 1
+        while True:
+            try:
+                await self._open_session()
+                return
+            except Exception as e:
+                print(f"MCP reconnect to {self.url} failed ({e}); retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _schedule_replacement(self):
+        task = self._loop.create_task(self._replace_session())
+        self._reconnects.add(task)
+        task.add_done_callback(self._reconnects.discard)
+
+    async def _start(self):
+        self._idle = asyncio.Queue()
+        results = await asyncio.gather(*(self._open_session() for _ in range(self.size)), return_exceptions=True)
+        failures = [r for r in results if isinstance(r, Exception)]
+        for _ in failures:
+            self._schedule_replacement()
+        if len(failures) == self.size:
+            raise failures[0]
+
+    async def _with_session(self, fn):
+        session, stop = await asyncio.wait_for(self._idle.get(), self.timeout)
+        try:
+            result = await asyncio.wait_for(fn(session), self.timeout)
+        except Exception:
+            stop.set()
+            self._schedule_replacement()
+            raise
+        self._idle.put_nowait((session, stop))
+        return result
+
+    async def _shutdown(self):
+        for task in list(self._reconnects):
+            task.cancel()
+        for stop in list(self._holders.values()):
+            stop.set()
+        # let each holder leave its session and transport contexts in its own task
+        await asyncio.gather(*self._reconnects, *self._holders, return_exceptions=True)
+
+    # -----------------------------
+    # blocking API for worker threads
+    # -----------------------------
+    def _submit(self, coro):
+        if self._closed:
+            coro.close()
+            raise RuntimeError("MCP client pool is closed")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._idle is None:
+                self._submit(self._start())
+
+    def list_tools(self):
+        self._ensure_started()
+        if self._tools is None:
+            self._tools = self._submit(self._with_session(lambda s: s.list_tools())).tools
+        return self._tools
+
+    def call_tool(self, name: str, arguments: dict = None) -> str:
+        """Run one tool call and return its text content."""
+        self._ensure_started()
+        result = self._submit(self._with_session(lambda s: s.call_tool(name, arguments or {})))
+        text = "\n".join(c.text for c in result.content if getattr(c, "text", None))
+        if result.isError:
+            raise Exception(f"MCP tool {name} failed: {text}")
+        return text
+
+    def close(self, timeout: float = 10):
+        """Close every session, then stop the loop thread."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout)
+        except Exception as e:
+            print(f"MCP sessions did not close cleanly: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._loop.close()
+
+
+clients.register("mcp", MCPClientPool, close=lambda pool: pool.close())
+
+
+def get_mcp_pool() -> MCPClientPool:
+    """The shared MCP session pool; its loop thread starts on first use."""
+    return clients.get("mcp")
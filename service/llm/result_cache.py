@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+from service.metrics import register_collector
+import os
+import re
+import threading
+import time
+
+load_dotenv()
+
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", str(24 * 3600)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1000"))
+
+
+def normalize_input(text: str) -> str:
+    """Case and whitespace differences should not defeat the cache."""
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+
+class AnalysisCache:
+    """
+    In-memory TTL + LRU cache of analyze_impact / analyze_pr stages.
+
+    Keys are (repo, graph_version, *params) and each key holds independent
+    stages ("retrieval" or "diff", "impact" or "answer", "report"), so a partial hit (e.g. the
+    retrieved nodes of a previous run) still skips that stage. Because the
+    graph version is part of the key, re-ingesting a repo makes all of its
+    old entries unreachable; they are purged as soon as a newer version is
+    cached.
+    """
+
+    def __init__(self, ttl: float = ANALYSIS_CACHE_TTL, max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, stage: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or stage not in entry["stages"] or time.time() - entry["created"] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["stages"][stage]
+
+    def put(self, key: tuple, stage: str, value):
+        repo, version = key[0], key[1]
+        with self._lock:
+            stale = [k for k in self._entries if k[0] == repo and k[1] != version]
+            for k in stale:
+                del self._entries[k]
+
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry["created"] > self.ttl:
+                entry = {"created": time.time(), "stages": {}}
+                self._entries[key] = entry
+            entry["stages"][stage] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, repo: str):
+        with self._lock:
+            for k in [k for k in self._entries if k[0] == repo]:
+                del self._entries[k]
+
+
+cache = AnalysisCache()
+
+register_collector(
+    "impact_analysis_cache_lookups_total", "counter", "Analysis stage cache lookups since start, by result",
+    lambda: {(("result", "hit"),): cache.hits, (("result", "miss"),): cache.misses},
+)
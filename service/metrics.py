@@ -0,0 +1,161 @@
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from typing import Callable, Dict
+import json
+import os
+import threading
+import time
+
+load_dotenv()
+
+# -----------------------------
+# METRICS CONFIG
+# -----------------------------
+# Print every finished span as a JSON line (stage, repo, file, duration)
+TRACE_SPANS = os.getenv("TRACE_SPANS", "false").lower() in ("1", "true", "yes")
+# Finished spans kept in memory for /traces
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "1000"))
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+COUNT_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+# name -> {"type", "help", "buckets"}; every metric is declared here so /metrics
+# lists it (with HELP / TYPE) before its first sample
+METRICS = {
+    "impact_stage_seconds": {
+        "type": "histogram", "buckets": SECONDS_BUCKETS,
+        "help": "Duration of onboarding and analysis stages (sync, discover, parse, collect, embed, write, "
+                "resolve_calls, ingest, retrieval, diff, diff_mapping, traversal, llm, mcp_tool, analysis)",
+    },
+    "impact_file_nodes": {"type": "histogram", "buckets": COUNT_BUCKETS, "help": "AST nodes per ingested file"},
+    "impact_file_edges": {"type": "histogram", "buckets": COUNT_BUCKETS,
+                          "help": "CHILD, DEF and USE edges per ingested file"},
+    "impact_files_total": {"type": "counter", "help": "Files through the ingestion pipeline, by result"},
+    "impact_neo4j_seconds": {"type": "histogram", "buckets": SECONDS_BUCKETS,
+                             "help": "Neo4j round trips, by operation (run, query, write_batch, writer_flush)"},
+    "impact_neo4j_rows_written_total": {"type": "counter", "help": "Rows sent to Neo4j in UNWIND writes"},
+    "impact_llm_tokens_total": {"type": "counter", "help": "Streamed LLM content chunks, by stage"},
+    "impact_queue_depth": {"type": "gauge", "help": "Items waiting or running, by queue (embed, write, analysis)"},
+}
+
+_lock = threading.Lock()
+# name -> {labels tuple: value} (counters / gauges) or {labels tuple: [bucket counts, sum, count]}
+_series: Dict[str, Dict] = {name: {} for name in METRICS}
+# metrics whose samples are read from elsewhere at scrape time
+_collectors: Dict[str, Callable] = {}
+_traces = deque(maxlen=TRACE_BUFFER)
+
+
+def _key(labels: Dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, amount: float = 1, **labels):
+    with _lock:
+        series = _series[name]
+        key = _key(labels)
+        series[key] = series.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, **labels):
+    with _lock:
+        _series[name][_key(labels)] = value
+
+
+def observe(name: str, value: float, **labels):
+    buckets = METRICS[name]["buckets"]
+    with _lock:
+        series = _series[name]
+        key = _key(labels)
+        hist = series.get(key)
+        if hist is None:
+            hist = series[key] = [[0] * len(buckets), 0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                hist[0][i] += 1
+        hist[1] += value
+        hist[2] += 1
+
+
+def register_collector(name: str, type_: str, help_: str, fn: Callable[[], Dict]):
+    """
+    A counter or gauge owned by another component (e.g. a cache's hit
+    counters): fn() returns {labels dict as tuple of (k, v): value} when scraped.
+    """
+    METRICS[name] = {"type": type_, "help": help_}
+    _collectors[name] = fn
+
+
+@contextmanager
+def span(name: str, **tags):
+    """
+    Time a stage into impact_stage_seconds{stage=name}. Tags (repo, file, ...)
+    only go on the trace record, to keep the histogram's label set small.
+    """
+    started = time.time()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        seconds = time.time() - started
+        observe("impact_stage_seconds", seconds, stage=name)
+        record = {"span": name, **tags, "start": round(started, 3), "seconds": round(seconds, 4)}
+        if error:
+            record["error"] = error
+        _traces.append(record)
+        if TRACE_SPANS:
+            print(json.dumps(record, default=str))
+
+
+def recent_spans(limit: int = 100, **tags):
+    """Newest finished spans first, optionally only those with the given tags (e.g. repo=...)."""
+    with _lock:
+        spans = list(_traces)
+    matching = [s for s in reversed(spans) if all(str(s.get(k)) == str(v) for k, v in tags.items())]
+    return matching[:limit]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in key + extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    with _lock:
+        # histogram values are mutated in place by observe(), so copy them under the lock too
+        snapshot = {
+            name: {key: [list(v[0]), v[1], v[2]] if METRICS[name]["type"] == "histogram" else v
+                   for key, v in series.items()}
+            for name, series in _series.items()
+        }
+    for name, fn in _collectors.items():
+        try:
+            snapshot[name] = fn()
+        except Exception as e:
+            print(f"metrics collector {name} failed: {e}")
+            snapshot[name] = {}
+
+    for name, meta in METRICS.items():
+        lines.append(f"# HELP {name} {meta['help']}")
+        lines.append(f"# TYPE {name} {meta['type']}")
+        for key, value in sorted(snapshot.get(name, {}).items()):
+            if meta["type"] != "histogram":
+                lines.append(f"{name}{_labels(key)} {value}")
+                continue
+            counts, total, count = value
+            for bound, n in zip(meta["buckets"], counts):
+                lines.append(f"{name}_bucket{_labels(key, (('le', str(bound)),))} {n}")
+            lines.append(f"{name}_bucket{_labels(key, (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(key)} {total}")
+            lines.append(f"{name}_count{_labels(key)} {count}")
+    return "\n".join(lines) + "\n"
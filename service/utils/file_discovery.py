@@ -0,0 +1,218 @@
+from dotenv import load_dotenv
+from typing import Dict, List
+import os
+import re
+
+load_dotenv()
+
+# -----------------------------
+# DISCOVERY CONFIG
+# -----------------------------
+# Files larger than this are never parsed (generated tables, data dumps, bundles)
+DISCOVERY_MAX_BYTES = int(os.getenv("DISCOVERY_MAX_BYTES", str(1024 * 1024)))
+# gitignore-style patterns excluded in every repo, on top of its own .gitignore files.
+# Build output directories only match at the repo root, so source packages named
+# build/ or target/ deeper down are kept. DISCOVERY_DEFAULT_EXCLUDES (comma-separated)
+# replaces this list ("" disables it); DISCOVERY_EXCLUDES adds patterns, and a
+# "!pattern" there re-includes something the defaults exclude (e.g. "!vendor/").
+_BUILTIN_EXCLUDES = [
+    ".*/", "node_modules/", "bower_components/", "jspm_packages/", "vendor/", "third_party/", "third-party/",
+    "Pods/", "/dist/", "/build/", "/out/", "/target/", "coverage/", "__pycache__/", "venv/", "site-packages/",
+    "*.egg-info/",
+]
+_DEFAULT_OVERRIDE = os.getenv("DISCOVERY_DEFAULT_EXCLUDES")
+DEFAULT_EXCLUDES = (_BUILTIN_EXCLUDES if _DEFAULT_OVERRIDE is None
+                    else [p.strip() for p in _DEFAULT_OVERRIDE.split(",") if p.strip()])
+EXTRA_EXCLUDES = [p.strip() for p in os.getenv("DISCOVERY_EXCLUDES", "").split(",") if p.strip()]
+# File names that are generated by tools or bundlers
+GENERATED_GLOBS = [
+    "*.min.*", "*-min.*", "*.bundle.*", "*-bundle.*", "*.chunk.*", "*.pb.go", "*_pb2.py", "*_pb2_grpc.py",
+    "*.pb.h", "*.pb.cc", "*.generated.*", "*.gen.*", "*_generated.*",
+]
+# Markers tools put in the leading comment block of files they generate
+_GENERATED_MARKERS = re.compile(
+    rb"@generated|code generated [^\n]* do not edit|<auto-generated|auto-?generated by\b.*?do not edit",
+    re.IGNORECASE | re.DOTALL,
+)
+_COMMENT_LINE = re.compile(rb"^\s*(?:#|//|/\*|\*|<!--|-->)")
+# Average line length (bytes) above which a file is taken to be minified
+MINIFIED_AVG_LINE = int(os.getenv("MINIFIED_AVG_LINE", "300"))
+_SNIFF_BYTES = 64 * 1024
+_HEADER_BYTES = 2048
+
+
+def _glob_regex(glob: str) -> str:
+    """gitignore glob -> regex: `*` / `?` stay within one path segment, `**` spans segments."""
+    out, i = "", 0
+    while i < len(glob):
+        if glob.startswith("**/", i):
+            out += "(?:.*/)?"
+            i += 3
+        elif glob.startswith("**", i):
+            out += ".*"
+            i += 2
+        elif glob[i] == "*":
+            out += "[^/]*"
+            i += 1
+        elif glob[i] == "?":
+            out += "[^/]"
+            i += 1
+        elif glob[i] == "[" and "]" in glob[i + 2:]:
+            end = glob.index("]", i + 2)
+            body = glob[i + 1:end]
+            out += "[" + ("^" + body[1:] if body.startswith("!") else body) + "]"
+            i = end + 1
+        else:
+            out += re.escape(glob[i])
+            i += 1
+    return out
+
+
+_NAME_GENERATED = [re.compile(_glob_regex(g) + "$", re.IGNORECASE) for g in GENERATED_GLOBS]
+
+
+def parse_ignore(lines: List[str], base: str = "") -> List[Dict]:
+    """
+    gitignore-style rules, applying below `base` (repo-relative dir of the
+    file they come from). Each rule is {regex, negate, dir_only, anchored, base}.
+    """
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n").rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        if line.startswith("\\"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        # a slash anywhere but the end anchors the pattern to `base`;
+        # otherwise it matches a name at any depth
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if not line:
+            continue
+        rules.append({
+            "regex": re.compile(_glob_regex(line) + "$"),
+            "negate": negate,
+            "dir_only": dir_only,
+            "anchored": anchored,
+            "base": base,
+        })
+    return rules
+
+
+def is_ignored(rules: List[Dict], rel: str, is_dir: bool) -> bool:
+    """Whether repo-relative `rel` is excluded by `rules`; as in git, the last matching rule wins."""
+    ignored = False
+    name = rel.rsplit("/", 1)[-1]
+    for r in rules:
+        if r["dir_only"] and not is_dir:
+            continue
+        if r["base"]:
+            if not rel.startswith(r["base"] + "/"):
+                continue
+            local = rel[len(r["base"]) + 1:]
+        else:
+            local = rel
+        if r["regex"].match(local if r["anchored"] else name):
+            ignored = not r["negate"]
+    return ignored
+
+
+def _read_rules(path: str, base: str) -> List[Dict]:
+    try:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            return parse_ignore(f.readlines(), base)
+    except OSError:
+        return []
+
+
+def _leading_comments(sample: bytes) -> bytes:
+    """The comment lines a file starts with (blank lines allowed), up to its first line of code."""
+    lines = []
+    in_block = False
+    for line in sample[:_HEADER_BYTES].split(b"\n"):
+        stripped = line.strip()
+        if in_block or not stripped or _COMMENT_LINE.match(line):
+            lines.append(line)
+        else:
+            break
+        if stripped.startswith(b"/*") or stripped.startswith(b"<!--"):
+            in_block = True
+        if stripped.endswith(b"*/") or stripped.endswith(b"-->"):
+            in_block = False
+    return b"\n".join(lines)
+
+
+def is_generated(path: str, name: str) -> bool:
+    """Generated by a tool (by file name or header marker) or minified (very long average lines)."""
+    if any(r.match(name) for r in _NAME_GENERATED):
+        return True
+    with open(path, "rb") as f:
+        sample = f.read(_SNIFF_BYTES)
+    if _GENERATED_MARKERS.search(_leading_comments(sample)):
+        return True
+    if len(sample) < 1024:
+        return False
+    return len(sample) / (sample.count(b"\n") + 1) > MINIFIED_AVG_LINE
+
+
+def discover_files(root: str, extensions, excludes: List[str] = None, max_bytes: int = None) -> List[str]:
+    """
+    Source files under the repo directory `root` with one of `extensions`,
+    as sorted absolute paths.
+
+    The walk (os.scandir, symlinks not followed) skips whatever the repo's
+    .gitignore files (at any depth) and .git/info/exclude ignore, plus the
+    `excludes` patterns (DEFAULT_EXCLUDES and DISCOVERY_EXCLUDES by default),
+    without descending into ignored directories. Files over `max_bytes`
+    (DISCOVERY_MAX_BYTES) and generated or minified files are left out.
+    """
+    extensions = {e.lower() for e in extensions}
+    max_bytes = max_bytes or DISCOVERY_MAX_BYTES
+    excludes = DEFAULT_EXCLUDES + EXTRA_EXCLUDES if excludes is None else excludes
+    base_rules = parse_ignore(excludes) + _read_rules(os.path.join(root, ".git", "info", "exclude"), "")
+
+    found = []
+    skipped = {"ignored": 0, "too_large": 0, "generated": 0}
+    stack = [("", base_rules)]
+    while stack:
+        rel_dir, rules = stack.pop()
+        abs_dir = os.path.join(root, rel_dir)
+        gitignore = os.path.join(abs_dir, ".gitignore")
+        if os.path.isfile(gitignore):
+            rules = rules + _read_rules(gitignore, rel_dir)
+        try:
+            entries = list(os.scandir(abs_dir))
+        except OSError:
+            continue
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if is_ignored(rules, rel, True):
+                    skipped["ignored"] += 1
+                else:
+                    stack.append((rel, rules))
+                continue
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            if os.path.splitext(entry.name)[1].lower() not in extensions:
+                continue
+            if is_ignored(rules, rel, False):
+                skipped["ignored"] += 1
+                continue
+            size = entry.stat(follow_symlinks=False).st_size
+            if size > max_bytes:
+                skipped["too_large"] += 1
+                continue
+            if is_generated(entry.path, entry.name):
+                skipped["generated"] += 1
+                continue
+            found.append(entry.path)
+
+    print(f"Discovered {len(found)} source files in {root} (skipped {skipped['ignored']} ignored paths, "
+          f"{skipped['too_large']} files over {max_bytes} bytes, {skipped['generated']} generated/minified)")
+    return sorted(found)
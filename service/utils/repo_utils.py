@@ -1,16 +1,232 @@
+from dotenv import load_dotenv
+from ..parser.ts_parser import EXT_MAP
+from .file_discovery import discover_files
+import codecs
+import hashlib
 import os
+import re
 import subprocess
+import uuid
 
-SOURCE_EXT = [".java", ".js", ".ts", ".py", ".go", ".kt"]
+load_dotenv()
+
+# Discovered extensions are exactly the ones the parser has a grammar for
+SOURCE_EXT = sorted(EXT_MAP)
+
+# "full" (whole history), "shallow" (last CLONE_DEPTH commits) or "blobless"
+# (whole history, file contents fetched on demand for the checked-out tree)
+CLONE_MODE = os.getenv("CLONE_MODE", "blobless")
+CLONE_DEPTH = int(os.getenv("CLONE_DEPTH", "1"))
+# Comma-separated directories to check out (cone-mode sparse checkout); empty = whole tree
+SPARSE_PATHS = [p.strip() for p in os.getenv("SPARSE_PATHS", "").split(",") if p.strip()]
+
+def _git(*args, cwd=None):
+    """Run a git command, raising with its stderr on failure; returns stdout."""
+    cmd = ["git"] + (["-C", cwd] if cwd else []) + list(args)
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise Exception(f"{' '.join(cmd)} failed: {result.stderr.strip()}")
+    return result.stdout.strip()
+
+def _has_commit(path, ref):
+    result = subprocess.run(
+        ["git", "-C", path, "cat-file", "-e", f"{ref}^{{commit}}"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    return result.returncode == 0
+
+def sync_repo(url, path, ref=None, mode=None, depth=None, sparse_paths=None):
+    """
+    Clone `url` into `path`, or fetch and update the existing clone there,
+    and return the commit now checked out.
+
+    mode is CLONE_MODE by default and only matters for the first clone:
+    "shallow" fetches the last `depth` commits (and keeps fetching that
+    deep), "blobless" fetches all commits and trees but file contents only
+    as checkouts need them, "full" everything. sparse_paths (SPARSE_PATHS)
+    restricts the work tree to those directories.
+
+    With `ref` (branch, tag or commit) the clone is pinned to it as a
+    detached HEAD; without it the checked-out branch is fast-forwarded to
+    the remote default branch. The clone is owned by the service, so when
+    that is not a fast-forward (force-pushed history, shallow graft) the
+    branch is reset to the remote.
+    """
+    mode = mode or CLONE_MODE
+    depth = depth or CLONE_DEPTH
+    sparse_paths = SPARSE_PATHS if sparse_paths is None else sparse_paths
+    if mode not in ("full", "shallow", "blobless"):
+        raise Exception(f"Unknown clone mode {mode!r}")
+
+    if not os.path.isdir(os.path.join(path, ".git")):
+        args = ["clone", "--no-checkout"]
+        if mode == "shallow":
+            args += ["--depth", str(depth)]
+        elif mode == "blobless":
+            args += ["--filter=blob:none"]
+        if sparse_paths:
+            args += ["--sparse"]
+        _git(*args, url, path)
+        fresh = True
+    else:
+        fresh = False
+
+    if sparse_paths:
+        _git("sparse-checkout", "set", *sparse_paths, cwd=path)
+
+    # A commit we already have needs no fetch; anything else (branch, tag,
+    # new commit, or the default branch) is fetched from origin
+    if ref and _has_commit(path, ref) and not _has_commit(path, f"origin/{ref}"):
+        target = ref
+    elif fresh and not ref:
+        target = "origin/HEAD"
+    else:
+        fetch = ["fetch", "--quiet", "origin", ref or "HEAD"]
+        if _is_shallow(path):
+            fetch += ["--depth", str(depth)]
+        _git(*fetch, cwd=path)
+        target = "FETCH_HEAD"
+
+    if ref:
+        _git("checkout", "--quiet", "--detach", target, cwd=path)
+    elif fresh:
+        _git("checkout", "--quiet", "-B", _default_branch(path), target, cwd=path)
+    else:
+        if _git("rev-parse", "--abbrev-ref", "HEAD", cwd=path) == "HEAD":
+            # was pinned to a ref before; back to tracking the default branch
+            _git("checkout", "--quiet", "-B", _default_branch(path), target, cwd=path)
+        else:
+            try:
+                _git("merge", "--quiet", "--ff-only", target, cwd=path)
+            except Exception:
+                print(f"{path}: not a fast-forward to the remote, resetting")
+                _git("reset", "--quiet", "--hard", target, cwd=path)
+
+    commit = head_commit(path)
+    print(f"Synced {url} at {commit} ({mode}{', sparse' if sparse_paths else ''})")
+    return commit
+
+def _is_shallow(path):
+    return _git("rev-parse", "--is-shallow-repository", cwd=path) == "true"
+
+def _default_branch(path):
+    try:
+        return _git("rev-parse", "--abbrev-ref", "origin/HEAD", cwd=path).split("/", 1)[-1]
+    except Exception:
+        return "main"
+
+def resolve_ref(path, ref):
+    """Commit of `ref` in the clone at `path`, fetching it from origin if it is not there yet (e.g. pull/42/head)."""
+    if _has_commit(path, ref):
+        return _git("rev-parse", f"{ref}^{{commit}}", cwd=path)
+    # Fetched into a ref of its own, not FETCH_HEAD, which concurrent analyses and syncs of the clone share
+    private = f"refs/impact/{uuid.uuid4().hex}"
+    try:
+        _git("fetch", "--quiet", "--no-write-fetch-head", "origin", f"+{ref}:{private}", cwd=path)
+        return _git("rev-parse", f"{private}^{{commit}}", cwd=path)
+    finally:
+        subprocess.run(["git", "-C", path, "update-ref", "-d", private], stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE)
+
+_HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+_STATUS = {"A": "added", "D": "deleted"}
+
+def _header_path(name):
+    """Repo-relative path of a ---/+++ patch header name (tab-terminated or C-quoted, a/ or b/ prefixed)."""
+    if name.startswith('"') and name.endswith('"'):
+        name = codecs.escape_decode(name[1:-1].encode())[0].decode("utf-8", "surrogateescape")
+    else:
+        name = name.rstrip("\t")
+    return name[2:]
+
+def diff_hunks(path, base, head):
+    """
+    Line-level changes of `head` against its merge base with `base`
+    (`git diff -U0 base...head`), as [{"path", "status", "hunks"}] with
+    status "added" / "deleted" / "modified" and hunks the changed line
+    ranges on the base side, (first line, line count); a count of 0 is a
+    pure insertion after that line. Returns (merge base commit, files).
+    """
+    try:
+        merge_base = _git("merge-base", base, head, cwd=path)
+    except Exception:
+        # shallow history without the common ancestor: compare the two trees directly
+        print(f"{path}: no merge base of {base} and {head}, diffing the two commits")
+        merge_base = _git("rev-parse", f"{base}^{{commit}}", cwd=path)
+    # Names and statuses from the NUL-separated listing: patch headers tab-terminate
+    # names with spaces and C-quote names with quotes, backslashes or control characters
+    listing = _git("diff", "--name-status", "-z", "--no-renames", merge_base, head, cwd=path).split("\0")
+    files, by_path = [], {}
+    for status, name in zip(listing[0::2], listing[1::2]):
+        entry = {"path": name, "status": _STATUS.get(status[:1], "modified"), "hunks": []}
+        files.append(entry)
+        by_path[name] = entry
+
+    out = _git("-c", "core.quotePath=false", "diff", "-U0", "--no-renames", "--no-color", "--no-ext-diff",
+               "--src-prefix=a/", "--dst-prefix=b/",
+               merge_base, head, cwd=path)
+    current = None
+    for line in out.split("\n"):
+        if line.startswith("diff --git "):
+            current = None
+        elif line.startswith("--- ") or line.startswith("+++ "):
+            name = line[4:]
+            if current is None and name != "/dev/null":
+                current = by_path.get(_header_path(name))
+        elif line.startswith("@@") and current is not None:
+            m = _HUNK.match(line)
+            if m:
+                count = 1 if m.group(2) is None else int(m.group(2))
+                current["hunks"].append((int(m.group(1)), count))
+    # binary and mode-only changes have no hunks
+    return merge_base, files
+
+def file_at(path, commit, rel):
+    """Bytes of repo-relative `rel` at `commit`, or None if it does not exist there."""
+    result = subprocess.run(["git", "-C", path, "show", f"{commit}:{rel}"], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        return None
+    return result.stdout
 
 def clone_repo(url, path):
-    if not os.path.exists(path):
-        subprocess.run(["git", "clone", url, path])
+    """Kept for callers of the old API: sync_repo with the configured defaults."""
+    return sync_repo(url, path)
 
 def list_source_files(root):
-    paths = []
-    for d, _, files in os.walk(root):
-        for f in files:
-            if any(f.endswith(ext) for ext in SOURCE_EXT):
-                paths.append(os.path.join(d, f))
-    return paths
\ No newline at end of file
+    """Parseable source files of the repo cloned at `root` (see file_discovery.discover_files)."""
+    return discover_files(root, SOURCE_EXT)
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def head_commit(path):
+    """Commit currently checked out in the clone at `path`, or None if it is not a git work tree."""
+    result = subprocess.run(
+        ["git", "-C", path, "rev-parse", "HEAD"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip()
+
+def changed_files(path, since):
+    """
+    Absolute paths of files added, modified, renamed or deleted between commit
+    `since` and HEAD. Returns None when the diff cannot be computed (unknown
+    commit, shallow history, not a git repo) so callers can fall back to
+    comparing content hashes.
+    """
+    result = subprocess.run(
+        ["git", "-C", path, "diff", "--name-status", "--no-renames", "-z", since, "HEAD"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if result.returncode != 0:
+        return None
+    parts = [p for p in result.stdout.split("\0") if p]
+    # -z output alternates status and path: "M\0a.py\0D\0b.py\0"
+    return {os.path.join(path, p) for p in parts[1::2]}